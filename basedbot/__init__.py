@@ -3,3 +3,7 @@ from .dbot import DBot
 from .confmgr import ConfigAccessLevel
 from .permmgr import has_permissions
 from .decorator import *
+from .guildcache import GuildCache
+from .keywords import KeywordMatcher
+from .scheduler import Scheduler
+from .coalesce import CoalescedCall
@@ -0,0 +1,66 @@
+import asyncio
+
+
+class CoalescedCall:
+    """Debounces and coalesces calls of a coroutine function into one call at a time
+
+    Requests that arrive before a call has started share that call. Requests that
+    arrive while a call is in flight share the next one, since the running call
+    might not reflect whatever caused them.
+    """
+
+    def __init__(self, func, delay):
+        self._func = func
+        self._delay = delay
+        self._lock = asyncio.Lock()
+        self._pending = None
+        self._wakeup = None
+        self._task = None
+
+    def request(self, urgent=False):
+        """Schedules a call and returns a future for its result
+
+        Urgent requests skip the remaining debounce delay.
+        """
+
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().create_future()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run(self._pending, self._wakeup))
+
+        if urgent:
+            self._wakeup.set()
+
+        return asyncio.shield(self._pending)
+
+    async def _run(self, future, wakeup):
+        try:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=self._delay)
+            except asyncio.TimeoutError:
+                pass
+
+            async with self._lock:
+                # From now on, requests have to wait for the next call
+                if self._pending is future:
+                    self._pending = None
+
+                future.set_result(await self._func())
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+            # Mark the exception as retrieved, callers that wait for the result still get it
+            future.exception()
+
+    def cancel(self):
+        """Cancels the scheduled call (if any)"""
+
+        if self._task is not None:
+            self._task.cancel()
+
+        # The task might not have started yet
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
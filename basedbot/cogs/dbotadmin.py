@@ -63,6 +63,12 @@ class DBotAdmin(commands.Cog):
             except sqlite3.OperationalError as e:
                 await ctx.send(f"```{e}```")
                 return
+            finally:
+                # The query might have modified cached data
+                self.bot.conf.invalidate(dbid, scope)
+                if scope == "global":
+                    self.bot.perm.index.invalidate()
+                self.bot.dispatch("database_invalidate", scope, str(dbid))
 
         if len(result) < 1:
             await ctx.message.add_reaction("\U00002705")
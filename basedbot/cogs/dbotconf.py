@@ -132,6 +132,7 @@ class DBotConf(commands.Cog):
             await ctx.send(f"```{e}```")
             return
 
+        self.bot.dispatch("conf_update", ctx.guild, name)
         await ctx.message.add_reaction("\U00002705")
 
     @conf.command(name="unset")
@@ -142,6 +143,7 @@ class DBotConf(commands.Cog):
 
         var = self.bot.conf.var(name)
         var.unset(ctx.guild.id)
+        self.bot.dispatch("conf_update", ctx.guild, name)
 
         await ctx.message.add_reaction("\U00002705")
 
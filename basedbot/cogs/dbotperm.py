@@ -192,28 +192,45 @@ class DBotPerm(commands.Cog):
         for perm in self.bot.perm.registered_permissions:
             perm.default(role.guild, role.id)
 
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        """Drops the cached permission rules of guilds that we left"""
+
+        self.bot.perm.index.invalidate(guild.id)
+
     async def _cleanup_invalid_entries(self):
         """Performs a sanity check of the database entries when the bot is ready"""
 
         await self.bot.wait_until_ready()
 
-        for perm in self.bot.perm.registered_permissions:
-            for guild in self.bot.guilds:
-                for entry in perm.definitions(guild):
-                    # ID is a valid member?
-                    if guild.get_member(entry):
-                        continue
-
-                    # ID is a valid role?
-                    if guild.get_role(entry):
-                        continue
-
-                    logging.info(
-                        "ID %s not found as member or role in guild %s, reset.",
-                        entry,
-                        guild,
-                    )
-                    perm.default(guild, entry)
+        # The rules of all guilds are stored in a single table
+        with self.bot.db.get("", scope="global") as db:
+            rows = db.execute("SELECT guild, name, id FROM guild_permissions").fetchall()
+
+        names = self.bot.perm.registered_permission_names
+
+        for row in rows:
+            guild = self.bot.get_guild(row["guild"])
+
+            if guild is None or row["name"] not in names:
+                continue
+
+            entry = row["id"]
+
+            # ID is a valid member?
+            if guild.get_member(entry):
+                continue
+
+            # ID is a valid role?
+            if guild.get_role(entry):
+                continue
+
+            logging.info(
+                "ID %s not found as member or role in guild %s, reset.",
+                entry,
+                guild,
+            )
+            self.bot.perm.get(row["name"]).default(guild, entry)
 
 
 async def setup(bot):
@@ -73,6 +73,12 @@ class DBotStats(commands.Cog):
             self._bot.statsd.gauge(
                 "users", sum([len(guild.members) for guild in self._bot.guilds])
             )
+            self._bot.statsd.gauge("conf_cache.size", len(self._bot.conf.cache))
+            self._bot.statsd.gauge("conf_cache.hits", self._bot.conf.cache.hits)
+            self._bot.statsd.gauge("conf_cache.misses", self._bot.conf.cache.misses)
+            self._bot.statsd.gauge("db.handles", self._bot.db.open_handles)
+            self._bot.statsd.gauge("db.opens", self._bot.db.opens)
+            self._bot.statsd.gauge("db.evictions", self._bot.db.evictions)
 
 
 async def setup(bot):
@@ -1,6 +1,8 @@
+from collections import OrderedDict
 from enum import Enum
 from typing import Optional
 from .converter import converter_from_def
+from .dbmgr import ctx_to_dbid
 
 
 class UnregisteredVariableException(Exception):
@@ -19,6 +21,53 @@ class ConfigAccessLevel(Enum):
     INTERNAL = 3
 
 
+class ConfigCache:
+    """A bounded LRU cache of raw configuration values"""
+
+    # Marks variables that are known to have no stored value
+    UNSET = object()
+
+    def __init__(self, maxsize=4096):
+        self._entries = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key):
+        """Returns the cached value for a key, or None if it isn't cached"""
+
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def store(self, key, value):
+        """Stores a value, evicting the least recently used entry if necessary"""
+
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, scope, dbid):
+        """Drops all cached values of a single database"""
+
+        for key in [k for k in self._entries if k[0] == scope and k[1] == dbid]:
+            del self._entries[key]
+
+    def clear(self):
+        """Drops all cached values"""
+
+        self._entries.clear()
+
+
 class ConfigVar:
     """A single configuration variable and its properties"""
 
@@ -31,8 +80,11 @@ class ConfigVar:
         description=None,
         scope="guild",
         conv=Optional[str],
+        *,
+        cache,
     ):
         self._db = db
+        self._cache = cache
 
         self.name = name
         self.default = default
@@ -41,18 +93,28 @@ class ConfigVar:
         self.scope = scope
         self.conv = converter_from_def(conv)
 
+    def _cache_key(self, ctx):
+        return self.scope, ctx_to_dbid(ctx, self.scope), self.name
+
     def get(self, ctx):
         """Gets the raw configuration value for a given context"""
 
-        with self._db.get(ctx, self.scope) as db:
-            result = db.execute(
-                "SELECT value FROM config WHERE name = ?", (self.name,)
-            ).fetchall()
+        key = self._cache_key(ctx)
+        value = self._cache.lookup(key)
+
+        if value is None:
+            with self._db.get(ctx, self.scope) as db:
+                result = db.execute(
+                    "SELECT value FROM config WHERE name = ?", (self.name,)
+                ).fetchall()
 
-        if len(result) < 1:
+            value = str(result[0][0]) if len(result) > 0 else ConfigCache.UNSET
+            self._cache.store(key, value)
+
+        if value is ConfigCache.UNSET:
             return self.default
 
-        return str(result[0][0])
+        return value
 
     async def cget(self, ctx):
         """Gets the converted configuration value for a given context"""
@@ -68,6 +130,8 @@ class ConfigVar:
                 "REPLACE INTO config (name, value) VALUES (?, ?)", (self.name, value)
             )
 
+        self._cache.store(self._cache_key(ctx), str(value))
+
     async def cset(self, ctx, value):
         """Converts the given value and sets it for a given context"""
 
@@ -80,6 +144,8 @@ class ConfigVar:
         with self._db.get(ctx, self.scope) as db:
             db.execute("DELETE FROM config WHERE name = ?", (self.name,))
 
+        self._cache.store(self._cache_key(ctx), ConfigCache.UNSET)
+
     async def show(self, ctx):
         """Converts the stored value to a human-readable representation"""
 
@@ -89,15 +155,16 @@ class ConfigVar:
 class ConfigManager:
     """Manages a collection of configuration variables"""
 
-    def __init__(self, db):
+    def __init__(self, db, cache_size=4096):
         self.db = db
+        self.cache = ConfigCache(cache_size)
         self._vars = {}
 
     def register(self, name, **kwargs):
         """Adds a new configuration variable with the given name and properties"""
 
         if name not in self._vars:
-            self._vars[name] = ConfigVar(self.db, name, **kwargs)
+            self._vars[name] = ConfigVar(self.db, name, cache=self.cache, **kwargs)
             return self._vars[name]
 
         existing = self._vars[name]
@@ -126,6 +193,11 @@ class ConfigManager:
 
         return self._vars[name]
 
+    def invalidate(self, ctx, scope="guild"):
+        """Drops all cached values for the database matching the given Context and scope"""
+
+        self.cache.invalidate(scope, ctx_to_dbid(ctx, scope))
+
     def get(self, ctx, name, **kwargs):
         """Legacy interface for getting raw configuration variable values"""
 
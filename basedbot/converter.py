@@ -1,5 +1,6 @@
 import typing
 import inspect
+import zoneinfo
 
 import discord
 from discord.ext import commands
@@ -335,3 +336,26 @@ class RoleConverter(Converter):
 
     async def _tostr(self, ctx, value):
         return f"@{value.name}"
+
+
+class ZoneInfoConverter(Converter):
+    """Converts IANA timezone names (e.g. Europe/Berlin)"""
+
+    @classmethod
+    def _lookup(cls, value):
+        try:
+            return zoneinfo.ZoneInfo(value)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError) as e:
+            raise InvalidConversionException(f"'{value}' is not a known timezone") from e
+
+    async def store(self, ctx, value):
+        if isinstance(value, zoneinfo.ZoneInfo):
+            return value.key
+
+        return self._lookup(value).key
+
+    async def load(self, ctx, value):
+        return self._lookup(value)
+
+    def name(self):
+        return "Timezone"
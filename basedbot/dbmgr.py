@@ -1,6 +1,13 @@
+import asyncio
+import functools
 import os
 import re
 import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from discord.ext.commands import Context
 
@@ -9,7 +16,50 @@ class NoValidContextException(Exception):
     """Thrown when a Context does not apply for a specific scope"""
 
 
-def _ctx_to_dbid(ctx, scope):
+# Accepted values for the configurable PRAGMAs (None accepts any integer)
+_PRAGMAS = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA", "0", "1", "2", "3"),
+    "cache_size": None,
+    "mmap_size": None,
+    "temp_store": ("DEFAULT", "FILE", "MEMORY", "0", "1", "2"),
+}
+
+
+def pragmas_from_environ():
+    """Reads the PRAGMA profile for database connections from the environment"""
+
+    pragmas = {
+        "journal_mode": os.environ.get("DBOT_DB_JOURNAL_MODE", "WAL"),
+        "synchronous": os.environ.get("DBOT_DB_SYNCHRONOUS", "NORMAL"),
+        "cache_size": os.environ.get("DBOT_DB_CACHE_SIZE"),
+        "mmap_size": os.environ.get("DBOT_DB_MMAP_SIZE"),
+        "temp_store": os.environ.get("DBOT_DB_TEMP_STORE"),
+    }
+
+    return {name: value for name, value in pragmas.items() if value}
+
+
+def _check_pragmas(pragmas):
+    checked = {}
+
+    for name, value in pragmas.items():
+        if name not in _PRAGMAS:
+            raise ValueError(f"PRAGMA `{name}` is not configurable")
+
+        if _PRAGMAS[name] is None:
+            checked[name] = int(value)
+            continue
+
+        if str(value).upper() not in _PRAGMAS[name]:
+            raise ValueError(f"`{value}` is not a valid value for PRAGMA `{name}`")
+
+        checked[name] = str(value).upper()
+
+    return checked
+
+
+def ctx_to_dbid(ctx, scope):
     """Fetches the correct database ID for a given scope from a Context"""
     # Global doesn't have a dbid, so just return 'global'
     if scope == "global":
@@ -31,13 +81,106 @@ def _ctx_to_dbid(ctx, scope):
     raise NoValidContextException(f"Context could not be converted for scope '{scope}'")
 
 
+def _read_scripts(path):
+    """Reads all versioned schema scripts in a directory ({schema: {version: script}})"""
+
+    scripts = {}
+
+    for filepath in Path(path).glob("*_*.sql"):
+        name, version = re.match(r"(\S+)_(\d+)", filepath.stem).groups()
+
+        with open(filepath, encoding="utf-8") as file:
+            scripts.setdefault(name, {})[int(version)] = file.read()
+
+    return scripts
+
+
+# The DatabaseManager of an upgrade worker process, created once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(dbpath, pragmas, sqlinfo):
+    manager = DatabaseManager(dbpath, pragmas=pragmas)
+
+    for info in sqlinfo:
+        manager.add_sql_path(info["path"], scope=info["scope"])
+
+    _WORKER["manager"] = manager
+
+
+def _upgrade_file(dbname, scope):
+    """Upgrades a single database file, returns the time taken and an error (if any)"""
+
+    start = time.perf_counter()
+
+    try:
+        # Open the file directly, get() would take care of the scope and ID again
+        _WORKER["manager"]._open(dbname, scope).close()  # pylint: disable=protected-access
+    except Exception:  # pylint: disable=broad-except
+        return time.perf_counter() - start, traceback.format_exc()
+
+    return time.perf_counter() - start, None
+
+
+def _execute(conn, query, params):
+    with conn:
+        return conn.execute(query, params).rowcount
+
+
+def _executemany(conn, query, seq_of_params):
+    with conn:
+        return conn.executemany(query, seq_of_params).rowcount
+
+
+def _fetchall(conn, query, params):
+    return conn.execute(query, params).fetchall()
+
+
+def _fetchone(conn, query, params):
+    return conn.execute(query, params).fetchone()
+
+
+def _transaction(conn, func, *args):
+    with conn:
+        return func(conn, *args)
+
+
 class DatabaseManager:
     """Manages database handles and schemas for a set of IDs and scopes"""
 
-    def __init__(self, dbpath):
-        self._db_handles = {}
+    def __init__(self, dbpath, max_handles=256, pragmas=None):
+        if max_handles < 1:
+            raise ValueError("At least one database handle has to be allowed")
+
+        self._db_handles = OrderedDict()
         self._dbpath = dbpath
+        self._pragmas = _check_pragmas(pragmas or {})
         self._sqlinfo = []
+        self._consolidations = []
+        self._max_handles = max_handles
+        self._plans = {}
+        self._upgraded = set()
+        self._lock = threading.RLock()
+        self.opens = 0
+        self.evictions = 0
+
+        # Handles used by the async interface, only touched from the database thread
+        self._async_handles = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dbot-db")
+
+        # Create the database directory if it doesn't exist
+        os.makedirs(self._dbpath, exist_ok=True)
+
+        self.add_sql_path(os.path.join(os.path.dirname(__file__), "sql"), scope="internal")
+        self.add_sql_path(
+            os.path.join(os.path.dirname(__file__), "sql", "global"), scope="global"
+        )
+
+        # Every DatabaseManager registers these by itself, e.g. those of upgrade workers
+        for info in self._sqlinfo:
+            info["builtin"] = True
+
+        self.add_consolidation("permissions", "guild_permissions", ("name", "id", "state"))
 
     @classmethod
     def _get_dbname(cls, dbid, scope):
@@ -46,30 +189,103 @@ class DatabaseManager:
 
         return f"{scope}_{dbid}"
 
+    def _open(self, dbname, scope):
+        # Create a new connection
+        conn = sqlite3.connect(f"{self._dbpath}/{dbname}.db", check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+
+        for name, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+        with self._lock:
+            self.opens += 1
+
+            if dbname not in self._upgraded:
+                self._upgrade_db(conn, scope)
+                self._upgraded.add(dbname)
+
+        return conn
+
+    def exists(self, ctx, scope="guild"):
+        """Checks whether a database matching the given Context and scope has been created"""
+
+        dbname = self._get_dbname(ctx_to_dbid(ctx, scope), scope)
+
+        if dbname in self._db_handles:
+            return True
+
+        return os.path.isfile(f"{self._dbpath}/{dbname}.db")
+
+    def _get_handle(self, handles, dbname, scope):
+        if dbname in handles:
+            handles.move_to_end(dbname)
+            return handles[dbname]
+
+        handles[dbname] = self._open(dbname, scope)
+
+        while len(handles) > self._max_handles:
+            # Handles aren't closed explicitly, since someone might still be using them.
+            # The connection is closed as soon as the last reference is gone.
+            handles.popitem(last=False)
+
+            with self._lock:
+                self.evictions += 1
+
+        return handles[dbname]
+
+    @property
+    def open_handles(self):
+        """Returns the number of handles that are currently kept open"""
+
+        return len(self._db_handles) + len(self._async_handles)
+
     def get(self, ctx, scope="guild"):
         """Returns a database handle matching the given Context and scope"""
 
-        dbid = _ctx_to_dbid(ctx, scope)
+        dbid = ctx_to_dbid(ctx, scope)
         dbid = self._get_dbname(dbid, scope)
 
-        if dbid not in self._db_handles:
-            # Create the database directory if it doesn't exist
-            if not os.path.isdir(self._dbpath):
-                os.mkdir(self._dbpath)
+        return self._get_handle(self._db_handles, dbid, scope)
 
-            # Create a new connection
-            self._db_handles[dbid] = sqlite3.connect(
-                f"{self._dbpath}/{dbid}.db", check_same_thread=False
-            )
-            self._db_handles[dbid].row_factory = sqlite3.Row
+    def _run(self, dbname, scope, func, *args):
+        return func(self._get_handle(self._async_handles, dbname, scope), *args)
 
-            # Update database structure for internal usage
-            self._upgrade_db_internal(self._db_handles[dbid])
+    async def run(self, ctx, func, *args, scope="guild"):
+        """Calls `func(handle, *args)` on the database thread and returns the result
+
+        The handle is a separate connection that must only be used from within `func`.
+        """
+
+        dbname = self._get_dbname(ctx_to_dbid(ctx, scope), scope)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(self._run, dbname, scope, func, *args)
+        )
 
-            # Update database structure from external sources
-            self._upgrade_db_external(self._db_handles[dbid], scope)
+    async def execute(self, ctx, query, params=(), scope="guild"):
+        """Executes and commits a single statement, returns the number of modified rows"""
 
-        return self._db_handles[dbid]
+        return await self.run(ctx, _execute, query, params, scope=scope)
+
+    async def executemany(self, ctx, query, seq_of_params, scope="guild"):
+        """Executes and commits a statement for each set of parameters"""
+
+        return await self.run(ctx, _executemany, query, list(seq_of_params), scope=scope)
+
+    async def fetchall(self, ctx, query, params=(), scope="guild"):
+        """Executes a query and returns all resulting rows"""
+
+        return await self.run(ctx, _fetchall, query, params, scope=scope)
+
+    async def fetchone(self, ctx, query, params=(), scope="guild"):
+        """Executes a query and returns the first resulting row (or None)"""
+
+        return await self.run(ctx, _fetchone, query, params, scope=scope)
+
+    async def transaction(self, ctx, func, *args, scope="guild"):
+        """Calls `func(handle, *args)` on the database thread inside of a single transaction"""
+
+        return await self.run(ctx, _transaction, func, *args, scope=scope)
 
     def add_sql_path(self, path, scope="guild"):
         """Adds a new entry to the list of database schema search paths"""
@@ -81,6 +297,55 @@ class DatabaseManager:
             }
         )
 
+        with self._lock:
+            self._plans.pop(scope, None)
+
+    def _get_plan(self, scope):
+        """Returns the cached migration plan (schema -> {version: script}) for a scope"""
+
+        with self._lock:
+            if scope not in self._plans:
+                self._plans[scope] = self._build_plan(scope)
+
+            return self._plans[scope]
+
+    def _build_plan(self, scope):
+        plan = {}
+        origin = {}
+
+        for sqlinfo in self._sqlinfo:
+            # Skip if not the correct scope
+            if sqlinfo["scope"] != scope:
+                continue
+
+            for schema, scripts in _read_scripts(sqlinfo["path"]).items():
+                if schema in origin and origin[schema] is not sqlinfo:
+                    raise ValueError(
+                        f"Duplicate schema `{schema}` found at `{sqlinfo['path']}`,"
+                        f" but already present at `{origin[schema]}`"
+                    )
+
+                origin[schema] = sqlinfo
+                plan.setdefault(schema, {}).update(scripts)
+
+        return plan
+
+    @classmethod
+    def _get_versions(cls, conn):
+        """Returns the internal version and the versions of all external schemas"""
+
+        try:
+            rows = conn.execute(
+                "SELECT NULL, user_version FROM pragma_user_version "
+                "UNION ALL SELECT name, version FROM version"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # The version table doesn't exist yet
+            return cls._get_user_version(conn), {}
+
+        versions = {row[0]: row[1] for row in rows}
+        return versions.pop(None), versions
+
     @classmethod
     def _get_user_version(cls, conn):
         return conn.execute("PRAGMA user_version").fetchone()[0]
@@ -90,85 +355,171 @@ class DatabaseManager:
         with conn as c:
             return c.execute(f"PRAGMA user_version = {int(version)}")
 
-    @classmethod
-    def _init_schema_version(cls, conn, schema):
-        with conn as c:
-            c.execute(
-                "INSERT OR IGNORE INTO version (name, version) VALUES (?, 0)", (schema,)
-            )
-
-    @classmethod
-    def _get_schema_version(cls, conn, schema):
-        return conn.execute(
-            "SELECT version FROM version WHERE name = ?", (schema,)
-        ).fetchone()[0]
-
     @classmethod
     def _set_schema_version(cls, conn, schema, version):
         with conn as c:
             return c.execute(
-                "UPDATE version SET version = ? WHERE name = ?", (version, schema)
+                "REPLACE INTO version (name, version) VALUES (?, ?)", (schema, version)
             )
 
-    @classmethod
-    def _upgrade_db_internal(cls, conn):
-        while True:
-            user_version = cls._get_user_version(conn)
-            path = f"basedbot/sql/internal_{user_version + 1}.sql"
+    def _upgrade_db(self, conn, scope):
+        internal = self._get_plan("internal").get("internal", {})
+        plan = self._get_plan(scope)
 
-            if not os.path.isfile(path):
-                break
+        user_version, versions = self._get_versions(conn)
 
-            with open(path, encoding="utf-8") as file:
-                conn.executescript(file.read())
+        # Update database structure for internal usage
+        if user_version + 1 in internal:
+            while user_version + 1 in internal:
+                user_version += 1
+                conn.executescript(internal[user_version])
 
-    def _upgrade_db_external(self, conn, scope):
-        schemas = self._find_schemas(scope)
+            versions = self._get_versions(conn)[1]
 
-        for schema, sqlinfo in schemas.items():
-            # Insert a default starting version if it doesn't exist
-            self._init_schema_version(conn, schema)
+        outdated = [
+            schema
+            for schema, scripts in plan.items()
+            if versions.get(schema, 0) + 1 in scripts
+        ]
 
-            # Backup old user_version and overwrite with schema version.
-            # (I'm aware that this is a terribly bad idea. But it works.)
-            user_ver = self._get_user_version(conn)
-            self._set_user_version(conn, self._get_schema_version(conn, schema))
+        if not outdated:
+            return
 
-            try:
-                while True:
-                    version = self._get_user_version(conn)
-                    path = f"{sqlinfo['path']}/{schema}_{version + 1}.sql"
+        # Update database structure from external sources. Those scripts
+        # overwrite the user_version, so it needs to be restored afterwards.
+        try:
+            for schema in outdated:
+                scripts = plan[schema]
+                version = versions.get(schema, 0)
 
-                    if not os.path.isfile(path):
-                        break
+                while version + 1 in scripts:
+                    version += 1
+                    conn.executescript(scripts[version])
+                    self._set_schema_version(conn, schema, version)
+        finally:
+            self._set_user_version(conn, user_version)
 
-                    with open(path, encoding="utf-8") as file:
-                        conn.executescript(file.read())
-            finally:
-                # Write back the current schema version and restore the old one
-                self._set_schema_version(conn, schema, self._get_user_version(conn))
-                self._set_user_version(conn, user_ver)
+    def _scope_of_file(self, dbname):
+        """Returns the scope of a database file name, or None if it doesn't have a valid one"""
 
-    def _find_schemas(self, scope):
-        schemas = {}
+        if dbname == "global":
+            return "global"
 
-        for sqlinfo in self._sqlinfo:
-            # Skip if not the correct scope
-            if sqlinfo["scope"] != scope:
+        scope, _, dbid = dbname.partition("_")
+
+        if not dbid or scope in ("global", "internal"):
+            return None
+
+        if not any(info["scope"] == scope for info in self._sqlinfo):
+            return None
+
+        return scope
+
+    def upgrade_all(self, processes=None):
+        """Upgrades all existing database files using a pool of worker processes
+
+        Yields tuples of (database name, seconds taken, error or None) as they complete.
+        Files that don't belong to a known scope are skipped, those are reported
+        with None as the time taken.
+        """
+
+        sqlinfo = [info for info in self._sqlinfo if not info.get("builtin")]
+        files = []
+
+        for dbname in sorted(path.stem for path in Path(self._dbpath).glob("*.db")):
+            scope = self._scope_of_file(dbname)
+
+            if scope is None:
+                yield dbname, None, "Not named after a known scope"
                 continue
 
-            for filepath in Path(sqlinfo["path"]).glob("*_*.sql"):
-                name = re.match(r"(\S+)_\d+", filepath.stem).group(1)
+            files.append((dbname, scope))
 
-                if name in schemas and schemas[name] is not sqlinfo:
-                    raise ValueError(
-                        f"Duplicate schema `{name}` found at `{sqlinfo['path']}`,"
-                        f" but already present at `{schemas[name]}`"
-                    )
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(self._dbpath, self._pragmas, sqlinfo),
+        ) as pool:
+            futures = {
+                pool.submit(_upgrade_file, dbname, scope): dbname
+                for dbname, scope in files
+            }
+
+            for future in as_completed(futures):
+                yield (futures[future],) + future.result()
+
+    def add_consolidation(self, table, target, columns, scope="guild"):
+        """Registers a table whose rows are moved to a shared table in the global database
+
+        The shared table needs the same columns, plus one that is named after the scope
+        and holds the ID of the database that a row came from.
+        """
+
+        self._consolidations.append(
+            {
+                "table": table,
+                "target": target,
+                "columns": columns,
+                "scope": scope,
+            }
+        )
+
+    def consolidate(self):
+        """Copies registered tables of all existing database files into their shared tables
+
+        Each table is only converted once, which is recorded in the global database.
+        The original rows are kept. Yields tuples of (shared table, number of files).
+        """
+
+        with self.get("", scope="global") as db:
+            done = {row[0] for row in db.execute("SELECT name FROM consolidated")}
 
-                schemas[name] = sqlinfo
+        for info in self._consolidations:
+            if info["target"] in done:
+                continue
+
+            yield info["target"], self._consolidate(**info)
+
+    def _consolidate(self, table, target, columns, scope):
+        columns = ", ".join(columns)
+        files = [
+            path
+            for path in sorted(Path(self._dbpath).glob(f"{scope}_*.db"))
+            if path.stem.partition("_")[2].isdigit()
+        ]
+
+        # A separate connection, since ATTACH can't be run inside of a transaction
+        conn = self._open("global", "global")
+
+        try:
+            for path in files:
+                # Bring the schema of the file up to date before reading from it
+                self._open(path.stem, scope).close()
+
+                conn.execute("ATTACH DATABASE ? AS source", (str(path),))
+
+                try:
+                    with conn:
+                        conn.execute(
+                            f"INSERT OR IGNORE INTO {target} ({scope}, {columns}) "
+                            f"SELECT ?, {columns} FROM source.{table}",
+                            (int(path.stem.partition("_")[2]),),
+                        )
+                finally:
+                    conn.execute("DETACH DATABASE source")
+
+            with conn:
+                conn.execute("INSERT INTO consolidated (name) VALUES (?)", (target,))
+        finally:
+            conn.close()
+
+        return len(files)
+
+    def _close_async(self):
+        for handle in self._async_handles.values():
+            handle.close()
 
-        return schemas
+        self._async_handles.clear()
 
     def close(self):
         """Closes all open handles"""
@@ -177,3 +528,5 @@ class DatabaseManager:
             handle.close()
 
         self._db_handles.clear()
+
+        self._executor.submit(self._close_async).result()
@@ -1,13 +1,17 @@
 import asyncio
 import logging
 import os
+import weakref
+from collections import OrderedDict
 from pathlib import Path
 
 import discord.ext.commands
 import statsd
 
-from .dbmgr import DatabaseManager
+from .dbmgr import DatabaseManager, pragmas_from_environ
 from .confmgr import ConfigManager
+from .guildcache import GuildCache
+from .msgview import MessageView
 from .permmgr import PermissionManager
 
 
@@ -19,14 +23,24 @@ class DBot(discord.ext.commands.Bot):
             options["command_prefix"] = DBot.fetch_prefix
 
         super().__init__(**options)
-        self.db = DatabaseManager(os.environ.get("DBOT_DBPATH", "db"))
-        self.conf = ConfigManager(self.db)
+        self.db = DatabaseManager(
+            os.environ.get("DBOT_DBPATH", "db"),
+            max_handles=int(os.environ.get("DBOT_DB_MAX_HANDLES", "256")),
+            pragmas=pragmas_from_environ(),
+        )
+        self.conf = ConfigManager(
+            self.db, cache_size=int(os.environ.get("DBOT_CONF_CACHE_SIZE", "4096"))
+        )
         self.perm = PermissionManager(self.db)
         if "STATSD_HOST" in os.environ:
             self.statsd = statsd.StatsClient(
                 os.environ.get("STATSD_HOST"), os.environ.get("STATSD_PORT")
             )
         self._cogpaths = ["basedbot/cogs"]
+        self._message_views = OrderedDict()
+        self._guild_caches = weakref.WeakSet()
+        self.add_listener(self._drop_guild_caches, "on_guild_remove")
+        self.add_listener(self._invalidate_guild_caches, "on_database_invalidate")
         self.conf.register(
             "prefix",
             default="!",
@@ -125,6 +139,36 @@ class DBot(discord.ext.commands.Bot):
 
         return cogs
 
+    def message_view(self, message):
+        """Returns the derived views of a message, shared between all handlers"""
+
+        view = self._message_views.get(message.id)
+
+        if view is None or view.message is not message:
+            view = MessageView(message)
+            self._message_views[message.id] = view
+
+            # Handlers of a message run right after each other, only keep recent ones
+            while len(self._message_views) > 64:
+                self._message_views.popitem(last=False)
+
+        return view
+
+    def guild_cache(self, query, build, scope="guild"):
+        """Creates a GuildCache that follows guild removals and database invalidations"""
+
+        cache = GuildCache(self.db, query, build, scope=scope)
+        self._guild_caches.add(cache)
+        return cache
+
+    async def _drop_guild_caches(self, guild):
+        for cache in list(self._guild_caches):
+            cache.pop(guild.id)
+
+    async def _invalidate_guild_caches(self, scope, dbid):
+        for cache in list(self._guild_caches):
+            cache.invalidate(scope, dbid)
+
     def fetch_prefix(self, message):
         """Find the set prefix for a server"""
 
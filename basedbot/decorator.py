@@ -2,10 +2,58 @@ import functools
 import discord
 
 __all__ = [
+    "message_filter",
     "raw_reaction_filter",
 ]
 
 
+def message_filter(guild_only=False, not_bot=False, guild_ids=None, contains=None):
+    """Filters events that are received by on_message handlers
+
+    All checks only use cheap attributes of the message (e.g. not the clean content).
+
+    Parameters
+    ----------
+    guild_only: :class:`bool`
+        If True, removes messages that are not from a guild. False by default.
+    not_bot: :class:`bool`
+        If True, removes messages that are sent by bots. False by default.
+    guild_ids: Optional[Iterable[:class:`int`]]
+        If set, removes messages from guilds that are not in the list. None by default.
+    contains: Optional[:class:`str`]
+        If set, removes messages whose raw content doesn't contain the string. None by default.
+    """
+
+    if guild_ids is not None:
+        guild_ids = frozenset(guild_ids)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            # Use the first Message argument as the message
+            message = next(filter(lambda e: isinstance(e, discord.Message), args))
+
+            if guild_only and message.guild is None:
+                return
+
+            if not_bot and message.author.bot:
+                return
+
+            if guild_ids is not None and (
+                message.guild is None or message.guild.id not in guild_ids
+            ):
+                return
+
+            if contains is not None and contains not in message.content:
+                return
+
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
 def raw_reaction_filter(
     guild_only=False, not_self=None, emoji_names=None, client_func=None
 ):
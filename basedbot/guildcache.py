@@ -0,0 +1,70 @@
+class GuildCache:
+    """Per-guild data that is built from a query and kept in memory
+
+    The data of a guild is loaded on first access by running `query` and passing
+    the resulting rows to `build`. With the guild scope, guilds without a database
+    are built from an empty list instead, so that no database is created just to
+    find out that there is nothing stored. Caches created through `DBot.guild_cache`
+    drop the data of guilds that the bot leaves and of databases that have been
+    modified externally.
+    """
+
+    def __init__(self, db, query, build, scope="guild"):
+        if scope not in ("guild", "global"):
+            raise ValueError(f"Guild data can't be loaded from scope '{scope}'")
+
+        self._db = db
+        self._query = query
+        self._build = build
+        self._scope = scope
+        self._data = {}
+
+    def __contains__(self, guild_id):
+        return guild_id in self._data
+
+    def _load(self, guild_id):
+        if self._scope == "global":
+            # Shared tables hold the data of all guilds, keyed by a guild column
+            with self._db.get("", scope="global") as db:
+                return db.execute(self._query, (guild_id,)).fetchall()
+
+        if not self._db.exists(guild_id):
+            return []
+
+        with self._db.get(guild_id) as db:
+            return db.execute(self._query).fetchall()
+
+    def get(self, guild_id):
+        """Returns the data of a guild, loading it if necessary"""
+
+        if guild_id not in self._data:
+            self._data[guild_id] = self._build(self._load(guild_id))
+
+        return self._data[guild_id]
+
+    def peek(self, guild_id, default=None):
+        """Returns the data of a guild if it has already been loaded"""
+
+        return self._data.get(guild_id, default)
+
+    def set(self, guild_id, data):
+        """Replaces the data of a guild"""
+
+        self._data[guild_id] = data
+
+    def pop(self, guild_id):
+        """Drops the data of a guild, it is reloaded on next access"""
+
+        return self._data.pop(guild_id, None)
+
+    def invalidate(self, scope, dbid):
+        """Drops all data that might have been loaded from the given database"""
+
+        if scope != self._scope:
+            return
+
+        if scope == "global":
+            self._data.clear()
+            return
+
+        self._data.pop(int(dbid), None)
@@ -0,0 +1,132 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """Finds all occurrences of a set of keywords in a single pass (Aho-Corasick)
+
+    Each keyword maps to a set of values, `find` returns the union of the values
+    of all keywords that appear in a text. Adding and removing keywords only
+    touches the trie, the failure links are rebuilt lazily on the next search.
+    """
+
+    def __init__(self, rules=()):
+        # The trie, as lists indexed by node (the root is node 0)
+        self._goto = [{}]
+        self._values = [set()]
+        self._fail = [0]
+
+        # Values of each node including those of its suffixes, built with the failure links
+        self._output = [frozenset()]
+
+        self._keywords = {}
+        self._dirty = False
+
+        for keyword, value in rules:
+            self.add(keyword, value)
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def __contains__(self, keyword):
+        return keyword in self._keywords
+
+    def _walk(self, keyword, create):
+        node = 0
+
+        for char in keyword:
+            child = self._goto[node].get(char)
+
+            if child is None:
+                if not create:
+                    return None
+
+                child = len(self._goto)
+                self._goto.append({})
+                self._values.append(set())
+                self._fail.append(0)
+                self._output.append(frozenset())
+                self._goto[node][char] = child
+
+            node = child
+
+        return node
+
+    def add(self, keyword, value):
+        """Adds a value that should be reported whenever the keyword appears"""
+
+        if not keyword:
+            raise ValueError("Keywords must not be empty")
+
+        node = self._walk(keyword, create=True)
+
+        if value not in self._values[node]:
+            self._values[node].add(value)
+            self._keywords[keyword] = node
+            self._dirty = True
+
+    def remove(self, keyword, value=None):
+        """Removes a value (or all values if None) from a keyword"""
+
+        node = self._keywords.get(keyword)
+
+        if node is None:
+            return
+
+        if value is None:
+            self._values[node].clear()
+        else:
+            self._values[node].discard(value)
+
+        # The trie nodes are kept, nodes without values don't produce any output
+        if not self._values[node]:
+            del self._keywords[keyword]
+
+        self._dirty = True
+
+    def _build(self):
+        self._output[0] = frozenset()
+        queue = deque()
+
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+
+        # Breadth-first, so that the failure link of each node is final before its children
+        while queue:
+            node = queue.popleft()
+            self._output[node] = frozenset(self._values[node]) | self._output[self._fail[node]]
+
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[child] = self._goto[fail].get(char, 0)
+                queue.append(child)
+
+        self._dirty = False
+
+    def find(self, text):
+        """Returns the values of all keywords that appear in the text"""
+
+        if self._dirty:
+            self._build()
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+
+        found = set()
+        node = 0
+
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+
+            node = goto[node].get(char, 0)
+
+            if output[node]:
+                found |= output[node]
+
+        return found
@@ -0,0 +1,30 @@
+import re
+from functools import cached_property
+
+import discord
+
+
+class MessageView:
+    """Derived views of a message, computed lazily and at most once"""
+
+    def __init__(self, message: discord.Message):
+        self.message = message
+
+    @cached_property
+    def clean_content(self):
+        """The message content with resolved mentions"""
+        return self.message.clean_content
+
+    @cached_property
+    def lower(self):
+        """The lowercase clean content"""
+        return self.clean_content.lower()
+
+    @cached_property
+    def dollar_tokens(self):
+        """All words prefixed by '$' in the clean content"""
+
+        if "$" not in self.message.content:
+            return []
+
+        return re.findall(r"\$(\w+)", self.clean_content)
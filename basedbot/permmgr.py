@@ -30,18 +30,63 @@ def has_permissions(*perms):
     return commands.check(predicate)
 
 
-def _build_id_list(member: discord.Member):
-    ids = [member.id]
-    ids += [role.id for role in reversed(member.roles)]
+class PermissionIndex:
+    """An in-memory copy of the permission rules of each guild
 
-    return ids
+    The rules of all guilds are kept in a shared table of the global database.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._guilds = {}
+
+    def rules(self, guild_id, name):
+        """Returns the rules (ID -> state) of a permission in a guild"""
+
+        if guild_id not in self._guilds:
+            with self._db.get("", scope="global") as db:
+                res = db.execute(
+                    "SELECT name, id, state FROM guild_permissions WHERE guild = ?",
+                    (guild_id,),
+                ).fetchall()
+
+            rules = {}
+            for row in res:
+                rules.setdefault(row["name"], {})[row["id"]] = row["state"] == 1
+
+            self._guilds[guild_id] = rules
+
+        return self._guilds[guild_id].get(name, {})
+
+    def update(self, guild_id, name, discord_id, state):
+        """Updates a single rule of a loaded guild (state None removes the rule)"""
+
+        if guild_id not in self._guilds:
+            return
+
+        rules = self._guilds[guild_id].setdefault(name, {})
+
+        if state is None:
+            rules.pop(discord_id, None)
+        else:
+            rules[discord_id] = state
+
+    def invalidate(self, guild_id=None):
+        """Drops the rules of a guild (or all guilds), forcing a reload on next access"""
+
+        if guild_id is None:
+            self._guilds.clear()
+            return
+
+        self._guilds.pop(guild_id, None)
 
 
 class Permission:
     """A single permission and its properties"""
 
-    def __init__(self, db, name, base=False, pretty_name=None):
+    def __init__(self, db, index, name, base=False, pretty_name=None):
         self._db = db
+        self._index = index
 
         self.name = name
         self.base = base
@@ -50,11 +95,7 @@ class Permission:
     def definitions(self, guild: discord.Guild):
         """Returns a list of all existing permission rules for a guild"""
 
-        with self._db.get(guild.id) as db:
-            res = db.execute(
-                "SELECT * FROM permissions WHERE name = ?", (self.name,)
-            ).fetchall()
-        return {row["id"]: (row["state"] == 1) for row in res}
+        return dict(self._index.rules(guild.id, self.name))
 
     def allowed(self, member: discord.Member):
         """Checks if a permission is granted for a given guild member"""
@@ -62,16 +103,19 @@ class Permission:
         if not isinstance(member, discord.Member):
             return False
 
-        ids = _build_id_list(member)
-        perms = self.definitions(member.guild)
+        perms = self._index.rules(member.guild.id, self.name)
 
         # Search for permission from the top
-        for i in ids:
-            # If no rule saved, go to next
-            if i not in perms:
-                continue
+        if perms:
+            if member.id in perms:
+                return perms[member.id]
+
+            for role in reversed(member.roles):
+                # If no rule saved, go to next
+                if role.id not in perms:
+                    continue
 
-            return perms[i]
+                return perms[role.id]
 
         # If we are here, no rule matched. Fall back to builtin permission.
         if isinstance(self.base, str):
@@ -82,43 +126,50 @@ class Permission:
     def grant(self, guild, discord_id):
         """Grants the permission to a given ID"""
 
-        with self._db.get(guild.id) as db:
+        with self._db.get("", scope="global") as db:
             db.execute(
-                "REPLACE INTO permissions (name, id, state) VALUES (?, ?, ?)",
-                (self.name, discord_id, 1),
+                "REPLACE INTO guild_permissions (guild, name, id, state) VALUES (?, ?, ?, ?)",
+                (guild.id, self.name, discord_id, 1),
             )
 
+        self._index.update(guild.id, self.name, discord_id, True)
+
     def deny(self, guild, discord_id):
         """Denies the permission for a given ID"""
 
-        with self._db.get(guild.id) as db:
+        with self._db.get("", scope="global") as db:
             db.execute(
-                "REPLACE INTO permissions (name, id, state) VALUES (?, ?, ?)",
-                (self.name, discord_id, 0),
+                "REPLACE INTO guild_permissions (guild, name, id, state) VALUES (?, ?, ?, ?)",
+                (guild.id, self.name, discord_id, 0),
             )
 
+        self._index.update(guild.id, self.name, discord_id, False)
+
     def default(self, guild, discord_id):
         """Removes existing rules for a given ID"""
 
-        with self._db.get(guild.id) as db:
+        with self._db.get("", scope="global") as db:
             db.execute(
-                "DELETE FROM permissions WHERE name = ? AND id = ?",
-                (self.name, discord_id),
+                "DELETE FROM guild_permissions WHERE guild = ? AND name = ? AND id = ?",
+                (guild.id, self.name, discord_id),
             )
 
+        self._index.update(guild.id, self.name, discord_id, None)
+
 
 class PermissionManager:
     """Manages a collection of permissions"""
 
     def __init__(self, db):
         self.db = db
+        self.index = PermissionIndex(db)
         self._perms = {}
 
     def register(self, name, **kwargs):
         """Adds a new permission with the given name and properties"""
 
         if name not in self._perms:
-            self._perms[name] = Permission(self.db, name, **kwargs)
+            self._perms[name] = Permission(self.db, self.index, name, **kwargs)
             return self._perms[name]
 
         existing = self._perms[name]
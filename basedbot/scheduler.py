@@ -0,0 +1,122 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+
+
+class Scheduler:
+    """Runs coroutine functions at given points in time
+
+    Jobs are kept in a heap ordered by their deadline. Cancelled or replaced jobs
+    stay in the heap and are skipped when they come up (lazy deletion). Deadlines
+    are rounded up to full seconds, so that all jobs of the same second fire together.
+    Jobs run as separate tasks, so a slow job doesn't delay the others.
+    """
+
+    def __init__(self):
+        # Heap of (deadline, sequence number, key)
+        self._heap = []
+        # Key -> (deadline, sequence number, func, args)
+        self._jobs = {}
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._running = set()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, key):
+        return key in self._jobs
+
+    def schedule(self, key, when, func, *args):
+        """Runs `func(*args)` at the timezone-aware datetime `when`
+
+        An existing job with the same key is replaced.
+        """
+
+        if when.tzinfo is None or when.utcoffset() is None:
+            raise ValueError("Jobs can only be scheduled for timezone-aware datetimes")
+
+        deadline = math.ceil(when.timestamp())
+        entry = (deadline, next(self._counter), key)
+
+        self._jobs[key] = entry[:2] + (func, args)
+        heapq.heappush(self._heap, entry)
+
+        # Too many stale entries, rebuild the heap from scratch
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = [job[:2] + (k,) for k, job in self._jobs.items()]
+            heapq.heapify(self._heap)
+
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        elif self._heap[0][1] == entry[1]:
+            # The new job is due before everything else, so the runner has to wake up early
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """Removes the job with the given key (if any)"""
+
+        self._jobs.pop(key, None)
+
+    def stop(self):
+        """Stops running jobs, all scheduled jobs are dropped"""
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        for task in self._running:
+            task.cancel()
+
+        self._heap.clear()
+        self._jobs.clear()
+
+    def _is_stale(self, entry):
+        job = self._jobs.get(entry[2])
+        return job is None or job[1] != entry[1]
+
+    def _pop_due(self, now):
+        due = []
+
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+
+            if not self._is_stale(entry):
+                due.append(self._jobs.pop(entry[2]))
+
+        return due
+
+    async def _run(self):
+        while True:
+            # Drop cancelled jobs from the top, so that we don't wake up for nothing
+            while self._heap and self._is_stale(self._heap[0]):
+                heapq.heappop(self._heap)
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+
+            if timeout is None or timeout > 0:
+                self._wakeup.clear()
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            for _, _, func, args in self._pop_due(time.time()):
+                task = asyncio.ensure_future(self._call(func, *args))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    @classmethod
+    async def _call(cls, func, *args):
+        try:
+            await func(*args)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Exception while running scheduled job %s", func)
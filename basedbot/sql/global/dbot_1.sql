@@ -0,0 +1,13 @@
+CREATE TABLE consolidated (
+  name TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE guild_permissions (
+  guild INTEGER NOT NULL,
+  name TEXT NOT NULL,
+  id INTEGER NOT NULL,
+  state INTEGER NOT NULL,
+  PRIMARY KEY (guild, name, id)
+) WITHOUT ROWID;
+
+PRAGMA user_version = 1;
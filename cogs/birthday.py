@@ -1,15 +1,59 @@
 import datetime
-import time
 import re
 from typing import Pattern, Optional
 import asyncio
+import zoneinfo
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 import basedbot
 
 
+# Number of requests to Discord that the daily jobs run at the same time
+CONCURRENCY = 10
+
+# Maximum number of missed days that are announced after a downtime
+CATCH_UP_DAYS = 7
+
+
+async def _limited(semaphore, coro):
+    async with semaphore:
+        return await coro
+
+
+# The dates of a leap year, indexed by their day of the year
+_DATES = [datetime.date(2000, 1, 1) + datetime.timedelta(days=i) for i in range(366)]
+
+
+def _day_of_year(day, month):
+    """Returns the index of a date in a leap year (0-365)"""
+
+    return datetime.date(2000, int(month), int(day)).timetuple().tm_yday - 1
+
+
+def _build_calendar(rows):
+    calendar = [set() for _ in range(366)]
+
+    for row in rows:
+        try:
+            calendar[_day_of_year(row["day"], row["month"])].add(row["userId"])
+        except ValueError:
+            # Invalid dates can only be inserted manually, skip them
+            pass
+
+    return calendar
+
+
+def _store_roles(db, cleared, assigned):
+    db.executemany(
+        "UPDATE guild_birthdays SET role = NULL WHERE guild = ? AND userId = ?", cleared
+    )
+    db.executemany(
+        "UPDATE guild_birthdays SET role = ? WHERE guild = ? AND userId = ?", assigned
+    )
+
+
 def _get_clean_name(ctx, userid):
     user = ctx.guild.get_member(userid)
 
@@ -19,11 +63,6 @@ def _get_clean_name(ctx, userid):
     return user.display_name.replace("```", "").strip()
 
 
-def _get_current_date() -> [int, int]:
-    date = datetime.datetime.now()
-    return date.day, date.month
-
-
 class Birthdays(commands.Cog):
     # pylint: disable=missing-class-docstring
 
@@ -36,16 +75,46 @@ class Birthdays(commands.Cog):
         r"(31\.((0?[13578])|(10)|(12))\.?)"
     )  # all months with 31 days
 
-    congratulate: tasks.Loop
-
     def __init__(self, bot):
         self.bot = bot
         self._var_channel = self.bot.conf.var("birthday.channel")
         self._var_role = self.bot.conf.var("birthday.role")
-        self.congratulate.start()
+        self._var_timezone = self.bot.conf.var("birthday.timezone")
+        self._var_last_run = self.bot.conf.var("birthday.last_run")
+        self._scheduler = basedbot.Scheduler()
+        self._semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        # Guild ID -> 366 sets of user IDs, indexed by the day of the year.
+        # The birthdays of all guilds are stored in a single table.
+        self._calendars = bot.guild_cache(
+            "SELECT userId, day, month FROM guild_birthdays WHERE guild = ?",
+            _build_calendar,
+            scope="global",
+        )
 
     def cog_unload(self):
-        self.congratulate.cancel()
+        self._scheduler.stop()
+
+    def _load_calendars(self):
+        """Loads the calendars of all guilds with a single query"""
+
+        with self.bot.db.get("", scope="global") as db:
+            result = db.execute(
+                "SELECT guild, userId, day, month FROM guild_birthdays"
+            ).fetchall()
+
+        rows = {guild.id: [] for guild in self.bot.guilds}
+
+        for row in result:
+            # Skip the rows of guilds that we aren't part of anymore
+            if row["guild"] in rows:
+                rows[row["guild"]].append(row)
+
+        for guild_id, guild_rows in rows.items():
+            self._calendars.set(guild_id, _build_calendar(guild_rows))
+
+    def _get_calendar(self, guild_id):
+        return self._calendars.get(guild_id)
 
     @commands.group(
         aliases=["birth", "birthday", "birthdate", "geburtstag"],
@@ -66,21 +135,23 @@ class Birthdays(commands.Cog):
         `query` is either a date or a user-id.
         """
 
-        with self.bot.db.get(ctx.guild.id) as db:
-            if len(query) == 0:  # No Query
-                results = db.execute(
-                    "SELECT userId, day, month FROM birthdays ORDER BY month, day"
-                ).fetchall()
-            elif self.DATEPATTERN.fullmatch(query) is not None:  # Birthday as Query
-                day, month = query.strip(".").split(".")
+        if len(query) == 0:  # No Query
+            calendar = self._get_calendar(ctx.guild.id)
+            results = [
+                (user, date.day, date.month)
+                for date, users in zip(_DATES, calendar)
+                for user in sorted(users)
+            ]
+        elif self.DATEPATTERN.fullmatch(query) is not None:  # Birthday as Query
+            day, month = query.strip(".").split(".")
+            users = self._get_calendar(ctx.guild.id)[_day_of_year(day, month)]
+            results = [(user, int(day), int(month)) for user in sorted(users)]
+        else:  # Username as Query
+            with self.bot.db.get("", scope="global") as db:
                 results = db.execute(
-                    "SELECT userId, day, month FROM birthdays WHERE day = ? AND month = ? ORDER BY month, day",
-                    (day, month),
-                ).fetchall()
-            else:  # Username as Query
-                results = db.execute(
-                    "SELECT userId, day, month FROM birthdays WHERE userId LIKE ? ORDER BY month, day",
-                    (query,),
+                    "SELECT userId, day, month FROM guild_birthdays "
+                    "WHERE guild = ? AND userId LIKE ? ORDER BY month, day",
+                    (ctx.guild.id, query),
                 ).fetchall()
 
         if len(results) == 0:
@@ -96,6 +167,30 @@ class Birthdays(commands.Cog):
 
         await self.bot.send_paginated(ctx, lines, textfmt="```{}```")
 
+    @birthdays.command()
+    @commands.guild_only()
+    @basedbot.has_permissions("birthday.list")
+    async def upcoming(self, ctx, days: int = 7):
+        """Lists the birthdays of the next few days (including today)"""
+
+        days = max(1, min(days, 366))
+        calendar = self._get_calendar(ctx.guild.id)
+        today = datetime.datetime.now(self._get_timezone(ctx.guild)).date()
+
+        lines = []
+
+        for i in range(days):
+            date = today + datetime.timedelta(days=i)
+
+            for user in sorted(calendar[_day_of_year(date.day, date.month)]):
+                lines.append(f"{date.day:02}.{date.month:02}. -> {_get_clean_name(ctx, user)}")
+
+        if len(lines) == 0:
+            await ctx.send("No entries found.")
+            return
+
+        await self.bot.send_paginated(ctx, lines, textfmt="```{}```")
+
     @birthdays.command()
     @commands.guild_only()
     @basedbot.has_permissions("birthday.add")
@@ -109,20 +204,23 @@ class Birthdays(commands.Cog):
             return
         day, month = birthdate.strip(".").split(".")
 
-        with self.bot.db.get(ctx.guild.id) as db:
+        with self.bot.db.get("", scope="global") as db:
             roles = db.execute(
-                "SELECT role FROM birthdays WHERE userId = ?",
-                (ctx.author.id,)
+                "SELECT role FROM guild_birthdays WHERE guild = ? AND userId = ?",
+                (ctx.guild.id, ctx.author.id)
             ).fetchall()
             if len(roles) >= 1:
                 role = ctx.guild.get_role(roles[0][0])
                 if role is not None:
                     await self._clear_role(ctx.author, role)
             db.execute(
-                "INSERT OR REPLACE INTO birthdays (userId, day, month) VALUES (?, ?, ?)",
-                (ctx.author.id, day, month),
+                "INSERT OR REPLACE INTO guild_birthdays (guild, userId, day, month) "
+                "VALUES (?, ?, ?, ?)",
+                (ctx.guild.id, ctx.author.id, day, month),
             )
 
+        self._calendars.pop(ctx.guild.id)
+
         await ctx.message.add_reaction("\U00002705")
 
     @birthdays.command()
@@ -130,19 +228,21 @@ class Birthdays(commands.Cog):
     async def remove(self, ctx):
         """Removes the birthday of the calling user"""
 
-        with self.bot.db.get(ctx.guild.id) as db:
+        with self.bot.db.get("", scope="global") as db:
             role_id = db.execute(
-                "SELECT role FROM birthdays WHERE userId = ?",
-                (ctx.author.id,)
+                "SELECT role FROM guild_birthdays WHERE guild = ? AND userId = ?",
+                (ctx.guild.id, ctx.author.id)
             ).fetchone()[0]
             role = ctx.guild.get_role(role_id)
             if role is not None:
                 await self._clear_role(ctx.author, role)
             db.execute(
-                "DELETE FROM birthdays WHERE userId = ?",
-                (ctx.author.id,),
+                "DELETE FROM guild_birthdays WHERE guild = ? AND userId = ?",
+                (ctx.guild.id, ctx.author.id),
             )
 
+        self._calendars.pop(ctx.guild.id)
+
         await ctx.message.add_reaction("\U00002705")
 
     async def _clear_role(self, member, role):
@@ -151,119 +251,235 @@ class Birthdays(commands.Cog):
 
         await member.remove_roles(role)
 
-        with self.bot.db.get(member.guild.id) as db:
+        with self.bot.db.get("", scope="global") as db:
             db.execute(
-                "UPDATE birthdays SET role = NULL WHERE userId = ?", (member.id,)
+                "UPDATE guild_birthdays SET role = NULL WHERE guild = ? AND userId = ?",
+                (member.guild.id, member.id),
             )
 
-    async def _clear_roles(self, guild):
-        if not guild.me.guild_permissions.manage_roles:
-            return
+    def _get_birthday_role(self, guild):
+        role = self._get_var(self._var_role, guild)
 
-        with self.bot.db.get(guild.id) as db:
-            users = db.execute(
-                "SELECT userId, role FROM birthdays WHERE role IS NOT NULL"
-            ).fetchall()
+        if role is None:
+            return None
+
+        return guild.get_role(int(role))
 
-        for e in users:
-            member = guild.get_member(e[0])
-            role = guild.get_role(e[1])
+    def _get_var(self, var, guild):
+        # Don't create databases just to find out that nothing has been configured
+        if not self.bot.db.exists(guild.id):
+            return var.default
 
-            if not member or not role:
-                continue
+        return var.get(guild.id)
 
-            await self._clear_role(member, role)
+    def _get_timezone(self, guild):
+        name = self._get_var(self._var_timezone, guild)
 
-    def _get_birthday_role(self, guild):
-        role = self._var_role.get(guild.id)
+        if name is not None:
+            try:
+                return zoneinfo.ZoneInfo(name)
+            except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+                pass
 
-        if role is None:
+        # Fall back to the local timezone of the host
+        return datetime.datetime.now().astimezone().tzinfo
+
+    def _get_last_run(self, guild):
+        last_run = self._get_var(self._var_last_run, guild)
+
+        if last_run is None:
             return None
 
-        return guild.get_role(int(role))
+        return datetime.date.fromisoformat(last_run)
 
-    @tasks.loop(hours=24)
-    async def congratulate(self):  # pylint: disable=function-redefined
-        """Repeatedly checks for new birthdays and sends congratulation messages"""
+    def _schedule(self, guild, catch_up=False):
+        """Schedules the daily job of a guild for its next local midnight"""
 
-        day, month = _get_current_date()
-        for guild in set(self.bot.guilds):
-            # Clear old birthday roles
-            await self._clear_roles(guild)
+        now = datetime.datetime.now(self._get_timezone(guild))
+        last_run = self._get_last_run(guild)
 
-            role = self._get_birthday_role(guild)
+        # Run right away if we missed a midnight
+        if catch_up and last_run is not None and last_run < now.date():
+            self._scheduler.schedule(guild.id, now, self._run_guild, guild.id)
+            return
 
-            text = f"Geburtstage am {day}.{month}.:"
-            users = (
-                self.bot.db.get(guild.id)
-                .execute(
-                    "SELECT userId FROM birthdays WHERE day = ? AND month = ?",
-                    (day, month),
-                )
-                .fetchall()
-            )
-            if len(users) == 0:
-                continue
+        tomorrow = now.date() + datetime.timedelta(days=1)
+        next_time = datetime.datetime.combine(
+            tomorrow, datetime.time(0, 0, 1), tzinfo=now.tzinfo
+        )  # Clip to 00:00:01
 
-            for e in users:
-                member = guild.get_member(e[0])
+        self._scheduler.schedule(guild.id, next_time, self._run_guild, guild.id)
 
-                if not member:
-                    continue
+    async def _run_guild(self, guild_id):
+        guild = self.bot.get_guild(guild_id)
 
-                text += (
-                    f"\n    :tada: :fireworks: :partying_face: **Alles Gute zum Geburtstag**, {member.mention} "
-                    f":partying_face: :fireworks: :tada: "
-                )
+        if guild is None:
+            return
+
+        try:
+            today = datetime.datetime.now(self._get_timezone(guild)).date()
+            last_run = self._get_last_run(guild)
+
+            # Don't run twice a day, e.g. after the timezone has been changed
+            if last_run is not None and last_run >= today:
+                return
+
+            # Announce the days that have been missed while the bot was offline
+            first = today
+            if last_run is not None:
+                first = max(last_run, today - datetime.timedelta(days=CATCH_UP_DAYS))
+                first += datetime.timedelta(days=1)
+
+            dates = [
+                first + datetime.timedelta(days=i) for i in range((today - first).days + 1)
+            ]
+
+            # Roles are cleared even if nobody has birthday anymore
+            await self._congratulate(guild, dates)
+
+            # Without a database nothing has been configured to announce, so don't
+            # create one just to remember the day
+            if self.bot.db.exists(guild.id):
+                self._var_last_run.set(guild.id, today.isoformat())
+        finally:
+            self._schedule(guild)
+
+    async def _congratulate(self, guild, dates):
+        """Sends congratulation messages for the given dates (the last one being today)"""
+
+        with self.bot.db.get("", scope="global") as db:
+            rows = db.execute(
+                "SELECT userId, role FROM guild_birthdays WHERE guild = ? AND role IS NOT NULL",
+                (guild.id,),
+            ).fetchall()
+
+        await self._congratulate_guild(guild, rows, dates)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # pylint: disable=missing-function-docstring
+        self._load_calendars()
+
+        for guild in self.bot.guilds:
+            self._schedule(guild, catch_up=True)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        """Schedules the daily job for new guilds"""
+
+        self._schedule(guild)
 
-                if (
-                    role is not None
-                    and guild.me.guild_permissions.manage_roles
-                    and guild.me.top_role > role
-                ):
-                    await member.add_roles(role)
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        """Stops the daily job for guilds that we left"""
+
+        self._scheduler.cancel(guild.id)
+
+    @commands.Cog.listener()
+    async def on_conf_update(self, guild, name):
+        """Moves the daily job when the timezone has been changed"""
 
-                    with self.bot.db.get(guild.id) as db:
-                        db.execute(
-                            "UPDATE birthdays SET role = ? WHERE userId = ?",
-                            (role.id, member.id),
-                        )
+        if guild is not None and name == "birthday.timezone":
+            self._schedule(guild)
 
-            channel = self._var_channel.get(guild.id)
+    async def _congratulate_guild(self, guild, rows, dates):
+        # pylint: disable=too-many-locals
+        semaphore = self._semaphore
+        can_manage_roles = guild.me.guild_permissions.manage_roles
 
-            if channel is None:
+        # Clear old birthday roles
+        removals = []
+        for row in rows:
+            if not can_manage_roles or row["role"] is None:
                 continue
 
-            channel = await self.bot.fetch_channel(channel)
+            member = guild.get_member(row["userId"])
+            role = guild.get_role(row["role"])
 
-            await channel.send(text)
+            if not member or not role or role >= guild.me.top_role:
+                continue
 
-    @congratulate.before_loop
-    async def congratulate_align(self):
-        """Aligns the congratulations to midnight"""
+            removals.append((member, role))
+
+        results = await asyncio.gather(
+            *(_limited(semaphore, m.remove_roles(r)) for m, r in removals),
+            return_exceptions=True,
+        )
+        cleared = [
+            (guild.id, m.id) for (m, _), res in zip(removals, results) if not isinstance(res, Exception)
+        ]
+
+        # Look up the birthdays of each date, the last date is today
+        calendar = self._get_calendar(guild.id)
+        birthdays = {}
+        for date in dates:
+            members = [
+                guild.get_member(user)
+                for user in sorted(calendar[_day_of_year(date.day, date.month)])
+            ]
+            birthdays[(date.day, date.month)] = [m for m in members if m]
+
+        # Give the birthday role to everyone who has birthday today
+        members = birthdays[(dates[-1].day, dates[-1].month)]
+
+        role = self._get_birthday_role(guild)
+        additions = []
+
+        if role is not None and can_manage_roles and guild.me.top_role > role:
+            additions = members
+
+        results = await asyncio.gather(
+            *(_limited(semaphore, m.add_roles(role)) for m in additions),
+            return_exceptions=True,
+        )
+        assigned = [
+            (role.id, guild.id, m.id) for m, res in zip(additions, results) if not isinstance(res, Exception)
+        ]
+
+        if cleared or assigned:
+            await self.bot.db.transaction(
+                "", _store_roles, cleared, assigned, scope="global"
+            )
 
-        current = datetime.datetime.now()
-        next_time = current + datetime.timedelta(days=1)  # Tomorrow
-        next_time = datetime.datetime(
-            next_time.year, next_time.month, next_time.day, 0, 0, 1, 0
-        )  # Clip to 00:00:01
+        # Only look up the channel if there is something to announce
+        if not any(birthdays.values()):
+            return
+
+        channel = self._get_var(self._var_channel, guild)
+
+        if channel is None:
+            return
 
-        # Convert into timestamps
-        current = time.mktime(current.timetuple())
-        next_time = time.mktime(next_time.timetuple())
+        channel = guild.get_channel(int(channel))
 
-        # Sleep until then
-        await asyncio.sleep(next_time - current)
+        if channel is None:
+            return
+
+        for (day, month), members in birthdays.items():
+            if len(members) == 0:
+                continue
+
+            text = f"Geburtstage am {day}.{month}.:"
+            for member in members:
+                text += (
+                    f"\n    :tada: :fireworks: :partying_face: **Alles Gute zum Geburtstag**, {member.mention} "
+                    f":partying_face: :fireworks: :tada: "
+                )
+
+            await _limited(semaphore, channel.send(text))
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
         """Cleans up the birthdays of members that left the server"""
 
         # Delete user from database
-        with self.bot.db.get(member.guild.id) as db:
-            db.execute("DELETE FROM birthdays WHERE userId = ?", (member.id,))
+        with self.bot.db.get("", scope="global") as db:
+            db.execute(
+                "DELETE FROM guild_birthdays WHERE guild = ? AND userId = ?",
+                (member.guild.id, member.id),
+            )
 
-        return
+        self._calendars.pop(member.guild.id)
 
 
 async def setup(bot):
@@ -278,6 +494,16 @@ async def setup(bot):
         conv=Optional[discord.Role],
         description="The role that birthday-people should get.",
     )
+    bot.conf.register(
+        "birthday.timezone",
+        conv=Optional[zoneinfo.ZoneInfo],
+        description="The timezone that decides when a day starts (None = host timezone).",
+    )
+    bot.conf.register(
+        "birthday.last_run",
+        access=basedbot.ConfigAccessLevel.INTERNAL,
+        description="The last day that birthdays have been announced for.",
+    )
     bot.perm.register("birthday.add", base=True, pretty_name="Add birthdays")
     bot.perm.register("birthday.list", base=True, pretty_name="List birthdays")
     await bot.add_cog(Birthdays(bot))
@@ -1,12 +1,14 @@
 import asyncio
 import datetime
 import json
+import logging
+import os
 import re
 import time
-from typing import Optional
+from typing import NamedTuple, Optional
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 import basedbot
 
@@ -18,11 +20,83 @@ def _reason_to_text(reason):
     return reason
 
 
-def _find_match(li, v):
-    if v not in li:
+class _InviteState(NamedTuple):
+    """The parts of an invite that are needed to attribute joins"""
+
+    uses: int
+    max_uses: int
+    inviter_id: Optional[int]
+
+
+def _invite_state(invite):
+    inviter_id = invite.inviter.id if invite.inviter is not None else None
+    return _InviteState(invite.uses or 0, invite.max_uses or 0, inviter_id)
+
+
+def _diff_snapshots(old, new):
+    """Returns (code, state) of all invites whose uses changed between two snapshots"""
+
+    used = []
+
+    for code, state in old.items():
+        current = new.get(code)
+
+        if current is None:
+            # Invite is gone (e.g. it reached max_uses), assume it has been used once more
+            used.append((code, state._replace(uses=state.uses + 1)))
+        elif current.uses != state.uses:
+            used.append((code, current))
+
+    # Invites that have been created and used in between two snapshots
+    for code, state in new.items():
+        if code not in old and state.uses > 0:
+            used.append((code, state))
+
+    return used
+
+
+def _build_snapshot(rows):
+    # An empty table means that there is no snapshot, not that there aren't any invites
+    if len(rows) == 0:
         return None
 
-    return li[li.index(v)]
+    return {
+        row["code"]: _InviteState(row["uses"], row["max_uses"], row["inviter"])
+        for row in rows
+    }
+
+
+def _store_snapshot(db, before, after):
+    """Writes the changes between two snapshots to the database"""
+
+    if before is None:
+        before = {}
+        db.execute("DELETE FROM invite_snapshot")
+
+    db.executemany(
+        "DELETE FROM invite_snapshot WHERE code = ?",
+        [(code,) for code in before if code not in after],
+    )
+    db.executemany(
+        "REPLACE INTO invite_snapshot (code, uses, max_uses, inviter) VALUES (?, ?, ?, ?)",
+        [(code,) + state for code, state in after.items() if before.get(code) != state],
+    )
+
+
+def _log_refresh_failure(future):
+    """Retrieves the result of a refresh that nobody waits for, so that failures get logged"""
+
+    if future.cancelled():
+        return
+
+    error = future.exception()
+
+    if error is not None:
+        logging.error("Failed to refresh invites", exc_info=error)
+
+
+# Seconds to wait for more events before refreshing invites that weren't used for a join
+_REFRESH_DELAY = 5
 
 
 class InviteManager(commands.Cog):
@@ -30,8 +104,18 @@ class InviteManager(commands.Cog):
 
     def __init__(self, bot):
         self._bot = bot
-        self._invs = {}
-        self._vanity = {}
+
+        # Guild ID -> invite code -> _InviteState, snapshots are replaced instead of modified
+        self._invs = bot.guild_cache(
+            "SELECT code, uses, max_uses, inviter FROM invite_snapshot", _build_snapshot
+        )
+        self._refreshes = {}
+        self._warmup_concurrency = int(
+            os.environ.get("DBOT_INVITE_WARMUP_CONCURRENCY", "8")
+        )
+
+        if self._warmup_concurrency < 1:
+            raise ValueError("The invite warm-up needs a concurrency of at least one")
         self._var_channel = self._bot.conf.var("invite.channel")
         self._var_inv_channel = self._bot.conf.var("invite.inv_channel")
         self._var_inv_count = self._bot.conf.var("invite.inv_count")
@@ -45,6 +129,10 @@ class InviteManager(commands.Cog):
         self._perm_request = self._bot.perm.get("invite.request")
         self._perm_manage = self._bot.perm.get("invite.manage")
 
+    def cog_unload(self):
+        for refresh in self._refreshes.values():
+            refresh.cancel()
+
     @commands.Cog.listener()
     async def on_ready(self):
         # pylint: disable=missing-function-docstring
@@ -53,8 +141,46 @@ class InviteManager(commands.Cog):
     async def _init_invites(self):
         await self._bot.wait_until_ready()
 
-        for g in self._bot.guilds:
-            await self._update_invites(g)
+        guilds = [g for g in self._bot.guilds if g.me.guild_permissions.manage_guild]
+        semaphore = asyncio.Semaphore(self._warmup_concurrency)
+        start = time.perf_counter()
+        done = 0
+
+        async def warm_up(guild):
+            nonlocal done
+
+            async with semaphore:
+                try:
+                    await self._request_refresh(guild, urgent=True)
+                finally:
+                    done += 1
+
+                    if done % 50 == 0:
+                        logging.info("Fetched invites of %d/%d guilds", done, len(guilds))
+
+        results = await asyncio.gather(
+            *(warm_up(g) for g in guilds), return_exceptions=True
+        )
+        failed = 0
+
+        for guild, result in zip(guilds, results):
+            if isinstance(result, Exception):
+                failed += 1
+                logging.error(
+                    "Failed to fetch invites of guild %d", guild.id, exc_info=result
+                )
+
+        duration = time.perf_counter() - start
+
+        logging.info(
+            "Fetched invites of %d guilds (%d failed) in %.3fs",
+            len(guilds),
+            failed,
+            duration,
+        )
+
+        if hasattr(self._bot, "statsd"):
+            self._bot.statsd.timing("invites.warmup", int(duration * 1000))
 
     @classmethod
     async def _get_vanity_invite(cls, guild):
@@ -66,16 +192,70 @@ class InviteManager(commands.Cog):
         except discord.errors.NotFound:
             return None
 
+    async def _fetch_snapshot(self, guild):
+        invites = await guild.invites()
+
+        # Share the fetched invites with other cogs, e.g. the ExpiredInvitesTracker
+        self._bot.dispatch("invites_fetched", guild, invites)
+
+        snapshot = {invite.code: _invite_state(invite) for invite in invites}
+
+        vanity_invite = await self._get_vanity_invite(guild)
+        if vanity_invite is not None:
+            # The vanity invite doesn't have an inviter, which marks it as such
+            snapshot[vanity_invite.code] = _InviteState(vanity_invite.uses or 0, 0, None)
+
+        return snapshot
+
+    def _get_snapshot(self, guild_id):
+        """Returns the current snapshot of a guild, falls back to the last stored one"""
+
+        return self._invs.get(guild_id)
+
     async def _update_invites(self, guild):
+        """Replaces the snapshot of a guild with a freshly fetched one and returns it"""
+
+        before = self._get_snapshot(guild.id)
+
         # Don't do anything if we don't have necessary permissions
         if not guild.me.guild_permissions.manage_guild:
-            return
+            if self._invs.pop(guild.id) is not None:
+                await self._bot.db.execute(guild.id, "DELETE FROM invite_snapshot")
 
-        self._invs[guild.id] = await guild.invites()
+            return None
 
-        vanity_invite = await self._get_vanity_invite(guild)
-        if vanity_invite is not None:
-            self._vanity[guild.id] = vanity_invite
+        after = await self._fetch_snapshot(guild)
+        self._invs.set(guild.id, after)
+
+        # The transaction runs on another thread, hand it copies that can't change meanwhile
+        before = dict(before) if before is not None else None
+        await self._bot.db.transaction(guild.id, _store_snapshot, before, dict(after))
+
+        return after
+
+    async def _refresh(self, guild_id):
+        # Don't hold on to the guild object, it might have been replaced meanwhile
+        guild = self._bot.get_guild(guild_id)
+
+        if guild is None:
+            return None
+
+        return await self._update_invites(guild)
+
+    def _request_refresh(self, guild, urgent=False):
+        guild_id = guild.id
+
+        if guild_id not in self._refreshes:
+            self._refreshes[guild_id] = basedbot.CoalescedCall(
+                lambda: self._refresh(guild_id), delay=_REFRESH_DELAY
+            )
+
+        return self._refreshes[guild_id].request(urgent=urgent)
+
+    def _refresh_later(self, guild):
+        """Requests a refresh without waiting for it"""
+
+        self._request_refresh(guild).add_done_callback(_log_refresh_failure)
 
     def _get_log_channel(self, guild):
         # Get stored channel
@@ -348,31 +528,55 @@ class InviteManager(commands.Cog):
     async def on_guild_join(self, guild):
         """Initializes invites when the bot joins a new server"""
 
-        await self._update_invites(guild)
+        await self._request_refresh(guild, urgent=True)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        """Stops refreshing the invites of guilds that we left"""
 
-    def _get_invite_data(self, invite):
+        refresh = self._refreshes.pop(guild.id, None)
+        if refresh is not None:
+            refresh.cancel()
+
+    async def _resolve_user(self, guild, user_id):
+        user = guild.get_member(user_id) or self._bot.get_user(user_id)
+
+        if user is not None:
+            return user
+
+        try:
+            return await self._bot.fetch_user(user_id)
+        except discord.errors.NotFound:
+            return None
+
+    async def _get_invite_data(self, guild, code, state):
         data = {
-            "invite": invite,
+            "code": code,
+            "uses": state.uses,
+            "max_uses": state.max_uses,
         }
 
-        if invite.inviter is not None:
-            data["inviter"] = invite.inviter
+        if state.inviter_id is not None:
+            inviter = await self._resolve_user(guild, state.inviter_id)
+
+            if inviter is not None:
+                data["inviter"] = inviter
 
         # Do we have that invite in the database?
-        with self._bot.db.get(invite.guild.id) as db:
+        with self._bot.db.get(guild.id) as db:
             result = db.execute(
-                "SELECT * FROM invite_active WHERE code = ?", (invite.code,)
+                "SELECT * FROM invite_active WHERE code = ?", (code,)
             ).fetchall()
         invite_data = result[0] if len(result) > 0 else None
 
         if invite_data:
-            data["inviter"] = invite.guild.get_member(invite_data["user"])
+            data["inviter"] = guild.get_member(invite_data["user"])
 
         if invite_data and invite_data["reason"]:
             data["reason"] = invite_data["reason"]
 
         if invite_data and invite_data["allowed_by"] != invite_data["user"]:
-            data["approver"] = invite.guild.get_member(invite_data["allowed_by"])
+            data["approver"] = guild.get_member(invite_data["allowed_by"])
 
         return data
 
@@ -389,8 +593,8 @@ class InviteManager(commands.Cog):
         if "approver" in data:
             text += f" (Approver: **{data['approver']}** [{data['approver'].id}])"
 
-        if data["invite"].max_uses != 0:
-            text += f" (Uses: {data['invite'].uses}/{data['invite'].max_uses})"
+        if data["max_uses"] != 0:
+            text += f" (Uses: {data['uses']}/{data['max_uses']})"
 
         return text
 
@@ -408,29 +612,21 @@ class InviteManager(commands.Cog):
         if not guild.me.guild_permissions.manage_guild:
             return
 
-        old = self._invs[guild.id]
-        self._invs[guild.id] = await guild.invites()
+        # Copy the snapshot before anything else can change it while we wait for the fetch
+        old = self._get_snapshot(guild.id)
+        if old is not None:
+            old = dict(old)
+
+        # Joins that happen at the same time share a single fetch
+        new = await self._request_refresh(guild, urgent=True)
 
         channel = self._get_log_channel(guild)
 
         if channel is None:
             return
 
-        invs = [
-            e
-            for e in old
-            if e not in self._invs[guild.id]
-            or _find_match(self._invs[guild.id], e).uses != e.uses
-        ]
-
-        if guild.id in self._vanity:
-            old_vanity = self._vanity[guild.id]
-            self._vanity[guild.id] = await self._get_vanity_invite(guild)
-
-            if self._vanity[guild.id] is None:
-                del self._vanity[guild.id]
-            elif old_vanity.uses != self._vanity[guild.id].uses:
-                invs.append(old_vanity)
+        # Without a previous snapshot, there is nothing to compare against
+        invs = _diff_snapshots(old, new) if old is not None and new is not None else []
 
         if len(invs) == 0:
             await channel.send(
@@ -439,12 +635,9 @@ class InviteManager(commands.Cog):
             return
 
         if len(invs) == 1:
-            invite = invs[0]
-
-            # Invite been used, so add one to the counter
-            invite.uses += 1
+            code, state = invs[0]
 
-            data = self._get_invite_data(invite)
+            data = await self._get_invite_data(guild, code, state)
 
             embed = discord.Embed(
                 title=f"**{member}** ({member.id}) joined the server.", color=0x0065BD
@@ -452,8 +645,8 @@ class InviteManager(commands.Cog):
 
             embed.add_field(
                 name="Invite",
-                value=invite.code
-                + (f" ({invite.uses}/{invite.max_uses})" if invite.max_uses else ""),
+                value=code
+                + (f" ({state.uses}/{state.max_uses})" if state.max_uses else ""),
                 inline=False,
             )
 
@@ -478,25 +671,43 @@ class InviteManager(commands.Cog):
             return
 
         text = f"I wasn't able to reliably determine how **{member}** [{member.id}] joined the server:"
-        for e in invs:
-            data = self._get_invite_data(e)
-            text += f"\n - Invite **{e.code}** {self._invite_data_to_text(data)}."
+        for code, state in invs:
+            data = await self._get_invite_data(guild, code, state)
+            text += f"\n - Invite **{code}** {self._invite_data_to_text(data)}."
 
         await channel.send(text)
         return
 
     @commands.Cog.listener()
     async def on_invite_create(self, invite):
-        """Refreshes invite cache when a new invite is created"""
+        """Adds new invites to the invite cache"""
+
+        snapshot = self._get_snapshot(invite.guild.id)
+
+        if snapshot is None:
+            self._refresh_later(invite.guild)
+            return
+
+        state = _invite_state(invite)
 
-        await self._update_invites(invite.guild)
+        # Joins might still hold the previous snapshot
+        self._invs.set(invite.guild.id, {**snapshot, invite.code: state})
+
+        await self._bot.db.execute(
+            invite.guild.id,
+            "REPLACE INTO invite_snapshot (code, uses, max_uses, inviter) VALUES (?, ?, ?, ?)",
+            (invite.code,) + state,
+        )
 
     @commands.Cog.listener()
     async def on_guild_update(self, before, after):
         """Refreshes invite cache when guild settings have been changed"""
 
-        del before
-        await self._update_invites(after)
+        # Only the vanity invite is part of the guild settings
+        if before.vanity_url_code == after.vanity_url_code:
+            return
+
+        self._refresh_later(after)
 
     async def _notify_invite_owner(self, invite, message):
         # Do we have that invite in the database?
@@ -518,9 +729,12 @@ class InviteManager(commands.Cog):
 
     @commands.Cog.listener()
     async def on_invite_delete(self, invite):
-        """Refreshes invite cache when an invite is deleted"""
+        """Removes deleted invites from the invite cache"""
 
-        await self._update_invites(invite.guild)
+        # Used up invites are deleted right away, possibly before the join has been
+        # attributed. The invite stays in the snapshot until the next fetch, so that
+        # the diff of that fetch can still count it as used.
+        self._refresh_later(invite.guild)
 
         if self._var_notify_deleted.get(invite.guild.id) != "0":
             try:
@@ -644,101 +858,43 @@ class InviteManager(commands.Cog):
 class ExpiredInvitesTracker(commands.Cog):
     """Simulates invite deletion events when an invite expires"""
 
-    check_invites: tasks.Loop
-
     def __init__(self, bot):
         self._bot = bot
-        self._exp_times = {}
-
-    @commands.Cog.listener()
-    async def on_ready(self):
-        # pylint: disable=missing-function-docstring
-        self._bot.loop.create_task(self._init_invites())
+        self._scheduler = basedbot.Scheduler()
 
-    @classmethod
-    def _calc_exp_time(cls, invite):
-        exp_time = invite.created_at + datetime.timedelta(seconds=invite.max_age)
-        return time.mktime(exp_time.timetuple())
+    def cog_unload(self):
+        self._scheduler.stop()
 
-    def _get_next_invite(self):
-        if len(self._exp_times) == 0:
-            return None
-
-        return min(self._exp_times, key=self._exp_times.get)
+    def _track(self, invite):
+        # Don't track if the invite doesn't expire
+        if not invite.max_age or invite.created_at is None:
+            return
 
-    async def _init_invites(self):
-        await self._bot.wait_until_ready()
+        exp_time = invite.created_at + datetime.timedelta(seconds=invite.max_age)
+        self._scheduler.schedule(invite.code, exp_time, self._expire, invite)
 
-        for g in self._bot.guilds:
-            if not g.me.guild_permissions.manage_guild:
-                continue
+    async def _expire(self, invite):
+        self._bot.dispatch("invite_delete", invite)
 
-            for i in await g.invites():
-                await self.on_invite_create(i, skip_start=True)
+    @commands.Cog.listener()
+    async def on_invites_fetched(self, guild, invites):
+        """Tracks all invites of a guild whenever the InviteManager fetched them"""
 
-        if not self.check_invites.is_running():
-            self.check_invites.start()
+        del guild
+        for i in invites:
+            self._track(i)
 
     @commands.Cog.listener()
-    async def on_invite_create(self, invite, skip_start=False):
+    async def on_invite_create(self, invite):
         """Adds invites to the tracking list when created"""
 
-        # Don't track if the invite doesn't expire
-        if invite.max_age == 0:
-            return
-
-        next_invite = self._get_next_invite()
-        self._exp_times[invite] = self._calc_exp_time(invite)
-
-        if skip_start or (
-            next_invite is not None
-            and self._exp_times[next_invite] < self._exp_times[invite]
-        ):
-            return
-
-        # Avoid cancelling if we are already cancelling
-        if self.check_invites.is_being_cancelled():
-            return
-
-        # Restart loop in case new invite has a smaller max_age
-        if self.check_invites.is_running():
-            self.check_invites.restart()
-        else:
-            self.check_invites.start()
+        self._track(invite)
 
     @commands.Cog.listener()
     async def on_invite_delete(self, invite):
         """Removes invites from the tracking list when deleted"""
 
-        # Don't do anything if the invite wasn't tracked
-        if invite not in self._exp_times:
-            return
-
-        del self._exp_times[invite]
-
-        if len(self._exp_times) == 0 and self.check_invites.is_running():
-            self.check_invites.cancel()
-
-    @tasks.loop()
-    async def check_invites(self):  # pylint: disable=function-redefined
-        """Repeatedly waits for the next invite to expire and fires an event"""
-
-        # Stop if no invites are left
-        if len(self._exp_times) == 0:
-            self.check_invites.cancel()
-            return
-
-        # Get next invite that expires
-        invite = self._get_next_invite()
-        exp_time = self._exp_times[invite]
-
-        # Sleep until then
-        await asyncio.sleep(
-            exp_time - time.mktime(datetime.datetime.utcnow().timetuple())
-        )
-
-        # Send out the event
-        self._bot.dispatch("invite_delete", invite)
+        self._scheduler.cancel(invite.code)
 
 
 async def setup(bot):
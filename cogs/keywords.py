@@ -0,0 +1,121 @@
+import discord
+from discord.ext import commands
+
+import basedbot
+
+
+class Keywords(commands.Cog):
+    # pylint: disable=missing-class-docstring
+
+    def __init__(self, bot):
+        self.bot = bot
+
+        # Guild ID -> KeywordMatcher (keyword -> reactions)
+        self._matchers = bot.guild_cache(
+            "SELECT keyword, reaction FROM keyword_reactions",
+            lambda rows: basedbot.KeywordMatcher(
+                (row["keyword"], row["reaction"]) for row in rows
+            ),
+        )
+
+    def _get_matcher(self, guild_id):
+        return self._matchers.get(guild_id)
+
+    @commands.group(aliases=["keyword"], invoke_without_command=True)
+    @commands.guild_only()
+    async def keywords(self, ctx):
+        """Manages reactions to keywords"""
+
+        await ctx.send_help(ctx.command)
+
+    @keywords.command()
+    @commands.guild_only()
+    @basedbot.has_permissions("keywords.manage")
+    async def add(self, ctx, reaction, *, keyword):
+        """Reacts with `reaction` to all messages containing `keyword`"""
+
+        keyword = keyword.strip().lower()
+
+        if not keyword:
+            await ctx.send("Keywords must not be empty.")
+            return
+
+        # Reacting to the command checks that the bot can use the emoji
+        try:
+            await ctx.message.add_reaction(reaction)
+        except discord.HTTPException:
+            await ctx.send("That is not an emoji I can react with.")
+            return
+
+        with self.bot.db.get(ctx.guild.id) as db:
+            db.execute(
+                "INSERT OR IGNORE INTO keyword_reactions (keyword, reaction) VALUES (?, ?)",
+                (keyword, reaction),
+            )
+
+        self._get_matcher(ctx.guild.id).add(keyword, reaction)
+
+    @keywords.command(aliases=["delete"])
+    @commands.guild_only()
+    @basedbot.has_permissions("keywords.manage")
+    async def remove(self, ctx, *, keyword):
+        """Removes all reactions to a keyword"""
+
+        keyword = keyword.strip().lower()
+
+        with self.bot.db.get(ctx.guild.id) as db:
+            count = db.execute(
+                "DELETE FROM keyword_reactions WHERE keyword = ?", (keyword,)
+            ).rowcount
+
+        if count == 0:
+            await ctx.send("That keyword doesn't exist.")
+            return
+
+        self._get_matcher(ctx.guild.id).remove(keyword)
+
+        await ctx.message.add_reaction("\U00002705")
+
+    @keywords.command()
+    @commands.guild_only()
+    @basedbot.has_permissions("keywords.manage")
+    async def list(self, ctx):
+        """Lists all keywords and their reactions"""
+
+        with self.bot.db.get(ctx.guild.id) as db:
+            result = db.execute(
+                "SELECT keyword, reaction FROM keyword_reactions ORDER BY keyword, reaction"
+            ).fetchall()
+
+        if len(result) == 0:
+            await ctx.send("No keywords found.")
+            return
+
+        lines = [f"{row['keyword']} -> {row['reaction']}" for row in result]
+
+        await self.bot.send_paginated(ctx, lines)
+
+    @commands.Cog.listener()
+    @basedbot.message_filter(guild_only=True, not_bot=True)
+    async def on_message(self, message):
+        """Adds the reactions of all keywords that appear in a message"""
+
+        matcher = self._get_matcher(message.guild.id)
+
+        if len(matcher) == 0:
+            return
+
+        for reaction in matcher.find(self.bot.message_view(message).lower):
+            try:
+                await message.add_reaction(reaction)
+            except discord.HTTPException:
+                # The emoji might have been deleted in the meantime
+                pass
+
+
+async def setup(bot):
+    # pylint: disable=missing-function-docstring
+    bot.perm.register(
+        "keywords.manage", base="administrator", pretty_name="Manage keyword reactions"
+    )
+    await bot.add_cog(Keywords(bot))
@@ -1,13 +1,28 @@
 from discord.ext import commands
 
+import basedbot
 
-def _is_cs_server(guild_id):
-    return guild_id in [
+_CS_SERVERS = frozenset(
+    [
         628452781199589377,
         752114765148455012,
         753556257377353738,
         885210119497973802,
     ]
+)
+
+
+_REACTIONS = basedbot.KeywordMatcher(
+    [
+        ("johannes", "\U0001F427"),
+        ("stöhr", "\U0001F427"),
+        ("lmu", ":lmuo:668091545878003712"),
+    ]
+)
+
+
+def _is_cs_server(guild_id):
+    return guild_id in _CS_SERVERS
 
 
 async def _check_cs_server(ctx):
@@ -31,25 +46,12 @@ class Johannes(commands.Cog):
         await ctx.send("\U0001F427")
 
     @commands.Cog.listener()
+    @basedbot.message_filter(not_bot=True, guild_ids=_CS_SERVERS)
     async def on_message(self, message):
         """Adds reactions to messages with certain words"""
 
-        if message.author.bot:
-            return
-
-        if message.guild is None:
-            return
-
-        if not _is_cs_server(message.guild.id):
-            return
-
-        lower = message.clean_content.lower()
-
-        # Reactions
-        if "johannes" in lower or "stöhr" in lower:
-            await message.add_reaction("\U0001F427")
-        if "lmu" in lower:
-            await message.add_reaction(":lmuo:668091545878003712")
+        for reaction in _REACTIONS.find(self.bot.message_view(message).lower):
+            await message.add_reaction(reaction)
 
 
 async def setup(bot):
@@ -1,5 +1,4 @@
 import io
-import re
 from urllib import request
 from urllib.parse import urlparse, quote
 from aiohttp import ClientTimeout, ClientSession
@@ -46,6 +45,15 @@ class MessageStore(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self._var_multiple = self.bot.conf.var("msg.multiple")
+
+        # Guild ID -> set of shorthand names
+        self._names = bot.guild_cache(
+            "SELECT name FROM msg", lambda rows: {row[0] for row in rows}
+        )
+
+    def _get_names(self, guild_id):
+        return self._names.get(guild_id)
 
     @commands.group(invoke_without_command=True)
     @basedbot.has_permissions("msg.list")
@@ -93,6 +101,8 @@ class MessageStore(commands.Cog):
                     (name.lower(), content),
                 )
 
+        self._get_names(ctx.guild.id).add(name.lower())
+
         await ctx.message.add_reaction("\U00002705")
 
     @msg.command()
@@ -197,35 +207,58 @@ class MessageStore(commands.Cog):
                 (name.lower(), "-" + name.lower()),
             )
 
+        names = self._get_names(ctx.guild.id)
+        names.discard(name.lower())
+        names.discard("-" + name.lower())
+
         await ctx.message.add_reaction("\U00002705")
 
     @commands.Cog.listener()
+    @basedbot.message_filter(guild_only=True, not_bot=True, contains="$")
     async def on_message(self, message):
         """Checks messages for a shorthand and prints the matching value"""
 
-        if message.author.bot:
+        names = self._get_names(message.guild.id)
+        if not names:
             return
 
-        search = re.search(r"\$(\w+)", message.clean_content)
-        if search is None:
-            return
+        keys = self.bot.message_view(message).dollar_tokens
+        if self._var_multiple.get(message.guild.id) != "1":
+            keys = keys[:1]
 
-        key = search.group(1)
+        # Resolve the keys to existing shorthands, preferring visible ones
+        matches = []
+        for key in keys:
+            for name in (key.lower(), "-" + key.lower()):
+                if name in names and name not in matches:
+                    matches.append(name)
+                    break
+
+        if len(matches) == 0:
+            return
 
         with self.bot.db.get(message.guild.id) as db:
             result = db.execute(
-                "SELECT name, content FROM msg WHERE name = ? OR name = ?",
-                (key.lower(), "-" + key.lower()),
+                "SELECT name, content FROM msg "
+                f"WHERE name IN ({', '.join('?' * len(matches))})",
+                matches,
             ).fetchall()
 
-        if len(result) == 0:
-            return
+        contents = {row[0]: row[1] for row in result}
 
-        await message.channel.send(result[0][1])
+        for name in matches:
+            if name in contents:
+                await message.channel.send(contents[name])
 
 
 async def setup(bot):
     # pylint: disable=missing-function-docstring
+    bot.conf.register(
+        "msg.multiple",
+        default="0",
+        conv=bool,
+        description="If true, all shorthands in a message are resolved instead of only the first one.",
+    )
     bot.perm.register("msg.list", base=True, pretty_name="List shorthands (msg)")
     bot.perm.register("msg.caption", base=True, pretty_name="Caption images (msg)")
     bot.perm.register(
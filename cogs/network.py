@@ -1,4 +1,6 @@
+import asyncio
 import functools
+import logging
 import sqlite3
 from typing import Optional
 
@@ -11,6 +13,9 @@ COLOR_NETWORK_JOIN = 0x00D100
 COLOR_MESSAGE_WARN = 0xF0BB2B
 COLOR_MESSAGE_CRIT = 0xED3E32
 
+# Number of guilds that are notified at the same time
+FANOUT_CONCURRENCY = 10
+
 
 class GuildNetworkMember:
     """Represents a guild that is a member of a specific guild network"""
@@ -70,18 +75,16 @@ class GuildNetworkMember:
 class GuildNetwork:
     """Represents a guild network"""
 
-    def __init__(self, bot, db, data):
+    def __init__(self, bot, db, data, members):
         self._bot = bot
         self._db = db
         self._nid = data["rowid"]
         self._name = data["name"]
 
-        # Populate members
-        with self._db.get("", scope="global") as dbh:
-            result = dbh.execute(
-                "SELECT gid FROM network_member WHERE nid = ?", (self._nid,)
-            ).fetchall()
-        self._members = {r[0]: self._fetch_member(r[0]) for r in result}
+        # Populate members from their network_member rows
+        self._members = {
+            r["gid"]: GuildNetworkMember(self._bot, self._db, self, r) for r in members
+        }
 
         self._owner = self.get_member(data["owner"])
 
@@ -123,35 +126,20 @@ class GuildNetwork:
         """Returns all guild network members"""
         return list(self._members.values())
 
+    @property
+    def member_ids(self):
+        """Returns the guild IDs of all guild network members"""
+        return list(self._members.keys())
+
     @property
     def admins(self):
         """Returns all guild network members that are administrators"""
         return [e for e in self.members if e.admin]
 
-    def _fetch_member(self, gid):
-        with self._db.get("", scope="global") as db:
-            result = db.execute(
-                "SELECT * FROM network_member WHERE nid = ? AND gid = ?",
-                (self._nid, gid),
-            ).fetchone()
-
-        if result is None:
-            return None
-
-        return GuildNetworkMember(self._bot, self._db, self, result)
-
     def get_member(self, gid):
         """Retrieves a guild network member by the guild ID"""
 
-        if gid not in self._members:
-            val = self._fetch_member(gid)
-
-            if val is None:
-                return None
-
-            self._members[gid] = val
-
-        return self._members[gid]
+        return self._members.get(gid)
 
     def join(self, gid):
         """Adds a guild (by guild ID) to a guild network"""
@@ -161,8 +149,13 @@ class GuildNetwork:
                 "REPLACE INTO network_member (nid, gid, admin) VALUES (?, ?, 0)",
                 (self._nid, gid),
             )
+            result = db.execute(
+                "SELECT * FROM network_member WHERE nid = ? AND gid = ?",
+                (self._nid, gid),
+            ).fetchone()
 
-        return self.get_member(gid)
+        self._members[gid] = GuildNetworkMember(self._bot, self._db, self, result)
+        return self._members[gid]
 
     def leave(self, gid):
         """Removes a guild (by guild ID) from a guild network"""
@@ -230,6 +223,9 @@ class GuildNetworks(commands.Cog):
         self._bot = bot
         self._networks = {}
 
+        # Guild ID -> set of IDs of the networks that the guild is a member of
+        self._guild_networks = {}
+
         self._var_channel = self._bot.conf.var("network.channel")
 
         self._perm_manage = self._bot.perm.get("network.manage")
@@ -243,8 +239,58 @@ class GuildNetworks(commands.Cog):
         await self._bot.wait_until_ready()
 
         with self._bot.db.get("", scope="global") as db:
-            result = db.execute("SELECT rowid FROM network").fetchall()
-        self._networks = {r[0]: self._fetch_network(r[0]) for r in result}
+            result = db.execute(
+                "SELECT n.rowid, n.name, n.owner, m.gid, m.admin, m.propagate_ban "
+                "FROM network n LEFT JOIN network_member m ON m.nid = n.rowid"
+            ).fetchall()
+
+        networks = {}
+        members = {}
+
+        for row in result:
+            networks.setdefault(row["rowid"], row)
+
+            # Networks without members only have a single row without member data
+            if row["gid"] is not None:
+                members.setdefault(row["rowid"], []).append(row)
+
+        self._networks = {}
+        self._guild_networks = {}
+
+        for nid, data in networks.items():
+            self._add_network(
+                GuildNetwork(self._bot, self._bot.db, data, members.get(nid, []))
+            )
+
+    def _add_network(self, network):
+        self._networks[network.id] = network
+
+        for gid in network.member_ids:
+            self._guild_networks.setdefault(gid, set()).add(network.id)
+
+    def _get_guild_networks(self, gid):
+        """Returns all networks that a guild is a member of"""
+
+        return [self._networks[nid] for nid in sorted(self._guild_networks.get(gid, ()))]
+
+    def _join_network(self, network, gid):
+        network.join(gid)
+        self._guild_networks.setdefault(gid, set()).add(network.id)
+
+    def _leave_network(self, network, gid):
+        network.leave(gid)
+        self._unindex(gid, network.id)
+
+    def _unindex(self, gid, nid):
+        nids = self._guild_networks.get(gid)
+
+        if nids is None:
+            return
+
+        nids.discard(nid)
+
+        if not nids:
+            del self._guild_networks[gid]
 
     def _create_network(self, name, gid):
         try:
@@ -265,23 +311,36 @@ class GuildNetworks(commands.Cog):
         with self._bot.db.get("", scope="global") as db:
             db.execute("DELETE FROM network WHERE rowid = ?", (nid,))
 
-        if nid in self._networks:
-            del self._networks[nid]
+        network = self._networks.pop(nid, None)
+
+        if network is None:
+            return
+
+        for gid in network.member_ids:
+            self._unindex(gid, nid)
 
     def _fetch_network(self, nid):
         with self._bot.db.get("", scope="global") as db:
             result = db.execute(
                 "SELECT rowid, * FROM network WHERE rowid = ?", (nid,)
             ).fetchone()
+            members = db.execute(
+                "SELECT * FROM network_member WHERE nid = ?", (nid,)
+            ).fetchall()
 
         if result is None:
             return None
 
-        return GuildNetwork(self._bot, self._bot.db, result)
+        return GuildNetwork(self._bot, self._bot.db, result, members)
 
     def _get_network(self, nid):
         if nid not in self._networks:
-            self._networks[nid] = self._fetch_network(nid)
+            network = self._fetch_network(nid)
+
+            if network is None:
+                return None
+
+            self._add_network(network)
 
         return self._networks[nid]
 
@@ -367,12 +426,9 @@ class GuildNetworks(commands.Cog):
         """Lists all networks the current guild is in"""
 
         entries = []
-        for n in self._networks.values():
+        for n in self._get_guild_networks(ctx.guild.id):
             member = n.get_member(ctx.guild.id)
 
-            if member is None:
-                continue
-
             entries.append(
                 {
                     "id": n.id,
@@ -403,7 +459,7 @@ class GuildNetworks(commands.Cog):
             await ctx.send("Network member could not be resolved.")
             return
 
-        network.leave(ctx.guild.id)
+        self._leave_network(network, ctx.guild.id)
 
         if len(network.members) == 0:
             self._delete_network(network.id)
@@ -430,24 +486,51 @@ class GuildNetworks(commands.Cog):
         await ctx.message.add_reaction("\U00002705")
 
     def _get_neighbor_members(self, guild, pred=None):
-        members = []
+        """Returns one network member per guild that shares a network with the given guild"""
 
-        for network in self._networks.values():
-            # Skip networks that the guild is not a member of
-            if network.get_member(guild.id) is None:
-                continue
+        members = []
+        seen = set()
 
+        for network in self._get_guild_networks(guild.id):
             for member in network.members:
-                if member in members:
+                if member.guild is None or member.guild.id in seen:
                     continue
 
                 if pred is not None and not pred(member):
                     continue
 
+                seen.add(member.guild.id)
                 members.append(member)
 
         return members
 
+    @classmethod
+    async def _fan_out(cls, network_members, func):
+        """Runs `func(network_member)` concurrently, returns a summary table of the results"""
+
+        semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+        async def run(network_member):
+            async with semaphore:
+                return await func(network_member)
+
+        results = await asyncio.gather(
+            *(run(m) for m in network_members), return_exceptions=True
+        )
+
+        summary = []
+
+        for network_member, result in zip(network_members, results):
+            if isinstance(result, Exception):
+                logging.error(
+                    "Error while notifying '%s'", network_member.guild, exc_info=result
+                )
+                result = f"Error: {type(result).__name__}"
+
+            summary.append({"guild": str(network_member.guild), "status": result})
+
+        return summary
+
     def _get_network_channel(self, guild):
         channel = self._var_channel.get(guild.id)
 
@@ -482,89 +565,85 @@ class GuildNetworks(commands.Cog):
             ctx.guild, pred=lambda nwm: self._get_network_channel(nwm.guild) is not None
         )
 
-        processed_guilds = []
-
-        for network_member in network_members:
-            g = network_member.guild
+        summary = await self._fan_out(
+            network_members,
+            lambda nwm: self._announce_ban(ctx, nwm, user, reason),
+        )
 
-            if g in processed_guilds:
-                continue
-            processed_guilds.append(g)
+        if len(summary) != 0:
+            await self._bot.send_table(ctx, ["guild", "status"], summary)
 
-            user_in_guild = user in g.members
+    async def _announce_ban(self, ctx, network_member, user, reason):
+        g = network_member.guild
+        member_on_target = g.get_member(user.id)
 
-            embed = discord.Embed(
-                title=f"{user} ({user.id}) has been banned from '{ctx.guild}'",
-                color=(COLOR_MESSAGE_CRIT if user_in_guild else COLOR_MESSAGE_WARN),
-            )
+        embed = discord.Embed(
+            title=f"{user} ({user.id}) has been banned from '{ctx.guild}'",
+            color=(
+                COLOR_MESSAGE_CRIT if member_on_target is not None else COLOR_MESSAGE_WARN
+            ),
+        )
 
+        if ctx.guild.icon is not None:
             embed.set_thumbnail(url=ctx.guild.icon.url)
 
-            if g == ctx.guild:
-                embed.add_field(
-                    name="Banned by",
-                    value=f"{ctx.author.mention} ({ctx.author.id})",
-                    inline=False,
-                )
-
-            if reason:
-                embed.add_field(name="Reason", value=reason, inline=False)
-
-            if user_in_guild:
-                if not network_member.propagate_ban:
-                    embed.add_field(
-                        name="Status", value="The user is on this server.", inline=False
-                    )
-                    await self._send_network_channel(g, embed=embed)
-                    continue
-
-                if not self._get_network_channel(g).permissions_for(g.me).ban_members:
-                    embed.add_field(
-                        name="Status",
-                        value="The user is on this server (Failed to ban: No permission).",
-                        inline=False,
-                    )
-                    await self._send_network_channel(g, embed=embed)
-                    continue
-
-                member_on_target = network_member.guild.get_member(user.id)
+        if g == ctx.guild:
+            embed.add_field(
+                name="Banned by",
+                value=f"{ctx.author.mention} ({ctx.author.id})",
+                inline=False,
+            )
 
-                if member_on_target is None:
-                    embed.add_field(
-                        name="Status",
-                        value="The user is on this server (Failed to ban: User not found).",
-                        inline=False,
-                    )
-                    await self._send_network_channel(g, embed=embed)
-                    continue
-
-                if member_on_target.top_role >= g.me.top_role:
-                    embed.add_field(
-                        name="Status",
-                        value="The user is on this server (Failed to ban: Role too high).",
-                        inline=False,
-                    )
-                    await self._send_network_channel(g, embed=embed)
-                    continue
+        if reason:
+            embed.add_field(name="Reason", value=reason, inline=False)
 
+        if member_on_target is None:
+            status = "Not on server"
+            embed.add_field(
+                name="Status",
+                value="The user is not on this server.",
+                inline=False,
+            )
+        elif not network_member.propagate_ban:
+            status = "On server"
+            embed.add_field(
+                name="Status", value="The user is on this server.", inline=False
+            )
+        elif not self._get_network_channel(g).permissions_for(g.me).ban_members:
+            status = "Failed to ban: No permission"
+            embed.add_field(
+                name="Status",
+                value="The user is on this server (Failed to ban: No permission).",
+                inline=False,
+            )
+        elif member_on_target.top_role >= g.me.top_role:
+            status = "Failed to ban: Role too high"
+            embed.add_field(
+                name="Status",
+                value="The user is on this server (Failed to ban: Role too high).",
+                inline=False,
+            )
+        else:
+            try:
                 await member_on_target.ban(
                     reason=f"{ctx.guild} ({ctx.guild.id}): {reason if reason else 'No reason given.'}",
                 )
+                status = "Banned"
                 embed.add_field(
                     name="Status",
                     value="The user was on this server.",
                     inline=False,
                 )
-                await self._send_network_channel(g, embed=embed)
-                continue
-            else:
+            except discord.HTTPException as e:
+                status = f"Failed to ban: {e.text or e.status}"
                 embed.add_field(
                     name="Status",
-                    value="The user is not on this server.",
+                    value=f"The user is on this server (Failed to ban: {e.text or e.status}).",
                     inline=False,
                 )
-                await self._send_network_channel(g, embed=embed)
-                continue
+
+        await self._send_network_channel(g, embed=embed)
+        return status
 
     @network.command(name="kick")
     @commands.has_permissions(kick_members=True)
@@ -582,46 +661,48 @@ class GuildNetworks(commands.Cog):
             ctx.guild, pred=lambda nwm: self._get_network_channel(nwm.guild) is not None
         )
 
-        processed_guilds = []
-
-        for network_member in network_members:
-            g = network_member.guild
+        summary = await self._fan_out(
+            network_members,
+            lambda nwm: self._announce_kick(ctx, nwm.guild, member, reason),
+        )
 
-            if g in processed_guilds:
-                continue
-            processed_guilds.append(g)
+        if len(summary) != 0:
+            await self._bot.send_table(ctx, ["guild", "status"], summary)
 
-            user_in_guild = member in g.members
+    async def _announce_kick(self, ctx, g, member, reason):
+        user_in_guild = g.get_member(member.id) is not None
 
-            embed = discord.Embed(
-                title=f"{member} ({member.id}) has been kicked from '{ctx.guild}'",
-                color=(COLOR_MESSAGE_CRIT if user_in_guild else COLOR_MESSAGE_WARN),
-            )
+        embed = discord.Embed(
+            title=f"{member} ({member.id}) has been kicked from '{ctx.guild}'",
+            color=(COLOR_MESSAGE_CRIT if user_in_guild else COLOR_MESSAGE_WARN),
+        )
 
+        if ctx.guild.icon is not None:
             embed.set_thumbnail(url=ctx.guild.icon.url)
 
-            if g == ctx.guild:
-                embed.add_field(
-                    name="Kicked by",
-                    value=f"{ctx.author.mention} ({ctx.author.id})",
-                    inline=False,
-                )
+        if g == ctx.guild:
+            embed.add_field(
+                name="Kicked by",
+                value=f"{ctx.author.mention} ({ctx.author.id})",
+                inline=False,
+            )
 
-            if reason:
-                embed.add_field(name="Reason", value=reason, inline=False)
+        if reason:
+            embed.add_field(name="Reason", value=reason, inline=False)
 
-            if user_in_guild:
-                embed.add_field(
-                    name="Status", value="The member is on this server.", inline=False
-                )
-            else:
-                embed.add_field(
-                    name="Status",
-                    value="The member is not on this server.",
-                    inline=False,
-                )
+        if user_in_guild:
+            embed.add_field(
+                name="Status", value="The member is on this server.", inline=False
+            )
+        else:
+            embed.add_field(
+                name="Status",
+                value="The member is not on this server.",
+                inline=False,
+            )
 
-            await self._send_network_channel(g, embed=embed)
+        await self._send_network_channel(g, embed=embed)
+        return "On server" if user_in_guild else "Not on server"
 
     @commands.Cog.listener()
     @basedbot.raw_reaction_filter(
@@ -680,7 +761,7 @@ class GuildNetworks(commands.Cog):
         # Mark as "approved"
         await message.remove_reaction("\U0000274E", self._bot.user)
 
-        network.join(guild.id)
+        self._join_network(network, guild.id)
 
         inviter = self._bot.get_guild(entry["inviter"])
 
@@ -1,3 +1,4 @@
+import random
 import re
 
 import discord
@@ -6,6 +7,24 @@ from discord.ext import commands
 import basedbot
 
 
+def _match_query(search):
+    """Turns a search into an FTS5 query, every word has to start a word in the quote"""
+
+    tokens = re.findall(r"\w+", search)
+
+    if not tokens:
+        return None
+
+    # Quoting keeps words like "AND" or "NEAR" from being parsed as operators
+    return " AND ".join(f'"{token}"*' for token in tokens)
+
+
+def _like_pattern(search):
+    """Searches without any words (e.g. only punctuation) fall back to a substring match"""
+
+    return "%" + re.sub(r"([\\%_])", r"\\\1", search) + "%"
+
+
 class Quotes(commands.Cog):
     """Manages quotes"""
 
@@ -14,17 +33,58 @@ class Quotes(commands.Cog):
 
         self._var_pretty = self.bot.conf.var("quotes.pretty")
 
+        # Guild ID -> list of quote IDs
+        self._ids = bot.guild_cache(
+            "SELECT id FROM quotes", lambda rows: [row[0] for row in rows]
+        )
+
+    def _get_ids(self, guild_id):
+        return self._ids.get(guild_id)
+
+    def _random_quote(self, guild_id):
+        """Picks a random quote with a primary key lookup instead of sorting the table"""
+
+        ids = self._get_ids(guild_id)
+
+        while ids:
+            quote_id = random.choice(ids)
+
+            with self.bot.db.get(guild_id) as db:
+                quote = db.execute(
+                    "SELECT content FROM quotes WHERE id = ?", (quote_id,)
+                ).fetchall()
+
+            if len(quote) != 0:
+                return quote
+
+            # The quote has been removed behind our back
+            ids.remove(quote_id)
+
+        return []
+
     @commands.group(invoke_without_command=True)
     async def quote(self, ctx, *, search=""):
         """Displays one random quote"""
 
-        search = "%" + re.sub(r"[^\x00-\x7F]+", "_", search) + "%"
-
-        with self.bot.db.get(ctx.guild.id) as db:
-            quote = db.execute(
-                "SELECT content FROM quotes WHERE LOWER(content) LIKE ? ORDER BY RANDOM() LIMIT 1",
-                (search,),
-            ).fetchall()
+        match = _match_query(search)
+
+        if not search:
+            quote = self._random_quote(ctx.guild.id)
+        elif match is not None:
+            with self.bot.db.get(ctx.guild.id) as db:
+                quote = db.execute(
+                    "SELECT content FROM quotes WHERE id IN "
+                    "(SELECT rowid FROM quotes_fts WHERE quotes_fts MATCH ?) "
+                    "ORDER BY RANDOM() LIMIT 1",
+                    (match,),
+                ).fetchall()
+        else:
+            with self.bot.db.get(ctx.guild.id) as db:
+                quote = db.execute(
+                    "SELECT content FROM quotes WHERE content LIKE ? ESCAPE '\\' "
+                    "ORDER BY RANDOM() LIMIT 1",
+                    (_like_pattern(search),),
+                ).fetchall()
 
         if len(quote) == 0:
             await ctx.send("No quotes found!")
@@ -78,7 +138,10 @@ class Quotes(commands.Cog):
             return
 
         with self.bot.db.get(ctx.guild.id) as db:
-            db.execute("INSERT INTO quotes (content) VALUES (?)", (content,))
+            cursor = db.execute("INSERT INTO quotes (content) VALUES (?)", (content,))
+
+        if ctx.guild.id in self._ids:
+            self._ids.peek(ctx.guild.id).append(cursor.lastrowid)
 
         await ctx.message.add_reaction("\U00002705")
 
@@ -87,13 +150,20 @@ class Quotes(commands.Cog):
     async def list(self, ctx, *, search=""):
         """Lists all the quotes"""
 
-        search = "%" + re.sub(r"[^\x00-\x7F]+", "_", search) + "%"
+        match = _match_query(search)
 
         with self.bot.db.get(ctx.guild.id) as db:
-            quotes = db.execute(
-                "SELECT content FROM quotes WHERE LOWER(content) LIKE ? ORDER BY content",
-                (search,),
-            ).fetchall()
+            if match is not None:
+                quotes = db.execute(
+                    "SELECT content FROM quotes_fts WHERE quotes_fts MATCH ? ORDER BY rank",
+                    (match,),
+                ).fetchall()
+            else:
+                quotes = db.execute(
+                    "SELECT content FROM quotes WHERE content LIKE ? ESCAPE '\\' "
+                    "ORDER BY content",
+                    (_like_pattern(search),),
+                ).fetchall()
 
         if len(quotes) == 0:
             await ctx.send("No quotes found.")
@@ -108,13 +178,19 @@ class Quotes(commands.Cog):
     async def delete(self, ctx, *, search):
         """Removes a quote"""
 
-        search = "%" + re.sub(r"[^\x00-\x7F]+", "_", search) + "%"
+        match = _match_query(search)
 
         with self.bot.db.get(ctx.guild.id) as db:
-            resulting_ids = db.execute(
-                "SELECT rowid FROM quotes WHERE LOWER(content) LIKE ? ORDER BY content",
-                (search,),
-            ).fetchall()
+            if match is not None:
+                resulting_ids = db.execute(
+                    "SELECT rowid FROM quotes_fts WHERE quotes_fts MATCH ? LIMIT 2",
+                    (match,),
+                ).fetchall()
+            else:
+                resulting_ids = db.execute(
+                    "SELECT id FROM quotes WHERE content LIKE ? ESCAPE '\\' LIMIT 2",
+                    (_like_pattern(search),),
+                ).fetchall()
 
         if len(resulting_ids) > 1:
             await ctx.send(
@@ -127,8 +203,15 @@ class Quotes(commands.Cog):
             )
             return
 
+        quote_id = resulting_ids[0][0]
+
         with self.bot.db.get(ctx.guild.id) as db:
-            db.execute("DELETE FROM quotes WHERE rowid = (?)", (resulting_ids[0][0],))
+            db.execute("DELETE FROM quotes WHERE id = ?", (quote_id,))
+
+        ids = self._ids.peek(ctx.guild.id)
+
+        if ids is not None and quote_id in ids:
+            ids.remove(quote_id)
 
         await ctx.message.add_reaction("\U00002705")
 
@@ -1,5 +1,4 @@
 import asyncio
-import functools
 
 from discord.ext import commands
 import discord
@@ -20,21 +19,14 @@ async def _decode_raw_reaction(bot, payload: discord.RawReactionActionEvent):
     return reaction, member
 
 
-def _decode_reaction(func):
-    @functools.wraps(func)
-    async def wrapper(self, payload: discord.RawReactionActionEvent):
-        # Ignore private messages
-        if payload.guild_id is None:
-            return
+def _build_routes(rows):
+    routes = {}
 
-        # Ignore own reactions
-        if payload.user_id == self.bot.user.id:
-            return
+    for row in rows:
+        emojis = routes.setdefault(row["message"], {})
+        emojis.setdefault(row["emoji"], set()).add(row["role"])
 
-        reaction, member = await _decode_raw_reaction(self.bot, payload)
-        return await func(self, reaction, member)
-
-    return wrapper
+    return routes
 
 
 async def _wait_for_user_reaction(bot, user, timeout=60):
@@ -50,6 +42,14 @@ class ReactionRoles(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+        # Guild ID -> message ID -> emoji -> set of role IDs
+        self._routes = bot.guild_cache(
+            "SELECT message, emoji, role FROM reactionroles", _build_routes
+        )
+
+    def _get_routes(self, guild_id):
+        return self._routes.get(guild_id)
+
     @commands.group(invoke_without_command=True)
     @commands.has_permissions(manage_roles=True)
     async def reactionroles(self, ctx):
@@ -87,22 +87,26 @@ class ReactionRoles(commands.Cog):
 
         message = reaction.message
         guild = message.guild
+        routes = self._get_routes(guild.id)
+        roles = routes.get(message.id, {}).get(str(reaction.emoji), set())
+
+        if role.id in roles:
+            await ctx.send(
+                "Hey you already added that emoji to that message and that Role!"
+            )
+            return
 
         with self.bot.db.get(guild.id) as db:
-            result = db.execute(
-                "SELECT * FROM reactionroles WHERE message == ? AND emoji == ? AND role = ?",
-                (message.id, str(reaction.emoji), role.id),
-            ).fetchall()
-            if len(result) > 0:
-                await ctx.send(
-                    "Hey you already added that emoji to that message and that Role!"
-                )
-                return
             db.execute(
                 "INSERT INTO reactionroles(message, emoji, role) VALUES(?, ?, ?)",
                 (message.id, str(reaction.emoji), role.id),
             )
 
+        # Only route the reaction once it has been stored
+        routes.setdefault(message.id, {}).setdefault(str(reaction.emoji), set()).add(
+            role.id
+        )
+
         await message.add_reaction(reaction.emoji)
         await reaction.remove(member)
 
@@ -131,31 +135,51 @@ class ReactionRoles(commands.Cog):
                 (message.id, str(reaction.emoji)),
             )
 
+        routes = self._get_routes(guild.id)
+        emojis = routes.get(message.id, {})
+        emojis.pop(str(reaction.emoji), None)
+
+        if not emojis:
+            routes.pop(message.id, None)
+
         await reaction.remove(guild.me)
         await reaction.remove(member)
 
     @commands.Cog.listener(name="on_raw_reaction_add")
-    @_decode_reaction
-    async def on_reaction_add(self, reaction, member):
+    async def on_reaction_add(self, payload: discord.RawReactionActionEvent):
         """Listens for new reactions and distributes the matching roles"""
 
-        if reaction.me:
+        # Ignore private messages
+        if payload.guild_id is None:
             return
 
-        message = reaction.message
-        guild = message.guild
+        # Ignore own reactions
+        if payload.user_id == self.bot.user.id:
+            return
 
-        with self.bot.db.get(guild.id) as db:
-            result = db.execute(
-                "SELECT DISTINCT role FROM reactionroles WHERE message = ? AND emoji = ?",
-                (message.id, str(reaction.emoji)),
-            ).fetchall()
+        # Check for a reactionrole before fetching anything
+        roles = (
+            self._get_routes(payload.guild_id)
+            .get(payload.message_id, {})
+            .get(str(payload.emoji))
+        )
 
-        if len(result) == 0:
+        if not roles:
             return
 
-        for entry in result:
-            role = discord.utils.get(guild.roles, id=int(entry[0]))
+        reaction, member = await _decode_raw_reaction(self.bot, payload)
+
+        if reaction.me:
+            return
+
+        guild = reaction.message.guild
+
+        for role_id in list(roles):
+            role = guild.get_role(role_id)
+
+            if role is None:
+                continue
+
             if role in member.roles:
                 await member.remove_roles(role)
             else:
@@ -187,6 +211,13 @@ class ReactionRoles(commands.Cog):
         if not payload.guild_id:
             return
 
+        routes = self._get_routes(payload.guild_id)
+
+        if payload.message_id not in routes:
+            return
+
+        del routes[payload.message_id]
+
         with self.bot.db.get(payload.guild_id) as db:
             db.execute(
                 "DELETE FROM reactionroles WHERE message = ?", (payload.message_id,)
@@ -196,6 +227,26 @@ class ReactionRoles(commands.Cog):
     async def on_guild_role_delete(self, role: discord.Role):
         """Remove reaction roles on roles that no longer exist"""
 
+        routes = self._get_routes(role.guild.id)
+        found = False
+
+        for message_id, emojis in list(routes.items()):
+            for emoji, roles in list(emojis.items()):
+                if role.id not in roles:
+                    continue
+
+                found = True
+                roles.discard(role.id)
+
+                if not roles:
+                    del emojis[emoji]
+
+            if not emojis:
+                del routes[message_id]
+
+        if not found:
+            return
+
         with self.bot.db.get(role.guild.id) as db:
             db.execute("DELETE FROM reactionroles WHERE role = ?", (role.id,))
 
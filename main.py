@@ -1,13 +1,32 @@
 #!/usr/bin/env python3
 
+import argparse
 import asyncio
 import logging
 import os
+import sys
+import time
 
 import discord
 from discord import Intents
 from discord.ext.commands.errors import ExtensionError
 from basedbot import DBot
+from basedbot.dbmgr import DatabaseManager, pragmas_from_environ
+
+
+def add_sql_paths(db):
+    # pylint: disable=missing-function-docstring
+    db.add_sql_path("sql/guild", scope="guild")
+    db.add_sql_path("sql/global", scope="global")
+    db.add_consolidation(
+        "birthdays", "guild_birthdays", ("userId", "day", "month", "role")
+    )
+
+
+def consolidate(db):
+    # pylint: disable=missing-function-docstring
+    for table, count in db.consolidate():
+        logging.info("Converted %d databases into the shared table '%s'", count, table)
 
 
 async def main():
@@ -17,11 +36,12 @@ async def main():
     bot.add_cog_path("cogs")
     bot.add_cog_path("cogs/legacy")
 
-    bot.db.add_sql_path("sql/guild", scope="guild")
-    bot.db.add_sql_path("sql/global", scope="global")
+    add_sql_paths(bot.db)
 
     discord.utils.setup_logging()
 
+    consolidate(bot.db)
+
     for cog in bot.find_all_cogs():
         try:
             await bot.load_extension(cog)
@@ -32,4 +52,67 @@ async def main():
         await bot.start(os.environ["DBOT_TOKEN"])
 
 
-asyncio.run(main())
+def migrate(processes):
+    """Upgrades and converts all databases without connecting to Discord"""
+
+    discord.utils.setup_logging()
+
+    db = DatabaseManager(
+        os.environ.get("DBOT_DBPATH", "db"), pragmas=pragmas_from_environ()
+    )
+    add_sql_paths(db)
+
+    start = time.perf_counter()
+    failed = 0
+    skipped = 0
+    total = 0
+
+    for dbname, duration, error in db.upgrade_all(processes=processes):
+        if duration is None:
+            skipped += 1
+            logging.warning("Skipped '%s': %s", dbname, error)
+            continue
+
+        total += 1
+
+        if error is not None:
+            failed += 1
+            logging.error("Failed to upgrade '%s' after %.3fs:\n%s", dbname, duration, error)
+            continue
+
+        logging.info("Upgraded '%s' in %.3fs", dbname, duration)
+
+    logging.info(
+        "Upgraded %d databases (%d failed, %d skipped) in %.3fs",
+        total - failed,
+        failed,
+        skipped,
+        time.perf_counter() - start,
+    )
+
+    if failed:
+        return 1
+
+    consolidate(db)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="upgrade and convert all databases in DBOT_DBPATH and exit",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes used by --migrate (default: CPU count)",
+    )
+    args = parser.parse_args()
+
+    if args.migrate:
+        sys.exit(migrate(args.jobs))
+
+    asyncio.run(main())
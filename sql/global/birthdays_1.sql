@@ -0,0 +1,13 @@
+CREATE TABLE guild_birthdays
+(
+    guild  INT NOT NULL,
+    userId INT NOT NULL,
+    day    INT NOT NULL,
+    month  INT NOT NULL,
+    role   INT,
+    PRIMARY KEY (guild, userId)
+);
+
+CREATE INDEX guild_birthdays_role ON guild_birthdays (guild) WHERE role IS NOT NULL;
+
+PRAGMA user_version = 1;
@@ -0,0 +1,3 @@
+CREATE INDEX guild_birthdays_date ON guild_birthdays (guild, month, day);
+
+PRAGMA user_version = 2;
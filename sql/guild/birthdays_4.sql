@@ -0,0 +1,4 @@
+DROP INDEX IF EXISTS birthdays_date;
+DROP INDEX IF EXISTS birthdays_role;
+
+PRAGMA user_version = 4;
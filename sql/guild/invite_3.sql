@@ -0,0 +1,5 @@
+CREATE INDEX invite_active_user ON invite_active (user);
+CREATE INDEX invite_active_allowed_by ON invite_active (allowed_by);
+CREATE INDEX invite_requests_user ON invite_requests (user);
+
+PRAGMA user_version = 3;
@@ -0,0 +1,9 @@
+CREATE TABLE invite_snapshot
+(
+    code     TEXT NOT NULL PRIMARY KEY,
+    uses     INT  NOT NULL,
+    max_uses INT  NOT NULL,
+    inviter  INT
+) WITHOUT ROWID;
+
+PRAGMA user_version = 4;
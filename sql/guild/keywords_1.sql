@@ -0,0 +1,7 @@
+CREATE TABLE keyword_reactions (
+  keyword TEXT NOT NULL,
+  reaction TEXT NOT NULL,
+  PRIMARY KEY (keyword, reaction)
+);
+
+PRAGMA user_version = 1;
@@ -0,0 +1,3 @@
+CREATE INDEX msg_name ON msg (name);
+
+PRAGMA user_version = 3;
@@ -0,0 +1,3 @@
+CREATE INDEX network_invites_message ON network_invites (message);
+
+PRAGMA user_version = 2;
@@ -0,0 +1,34 @@
+CREATE TABLE quotes_new
+(
+    id      INTEGER PRIMARY KEY,
+    content TEXT
+);
+
+INSERT INTO quotes_new (id, content) SELECT rowid, content FROM quotes;
+DROP TABLE quotes;
+ALTER TABLE quotes_new RENAME TO quotes;
+
+CREATE VIRTUAL TABLE quotes_fts USING fts5
+(
+    content,
+    content = 'quotes',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER quotes_fts_insert AFTER INSERT ON quotes BEGIN
+    INSERT INTO quotes_fts (rowid, content) VALUES (new.id, new.content);
+END;
+
+CREATE TRIGGER quotes_fts_delete AFTER DELETE ON quotes BEGIN
+    INSERT INTO quotes_fts (quotes_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+
+CREATE TRIGGER quotes_fts_update AFTER UPDATE ON quotes BEGIN
+    INSERT INTO quotes_fts (quotes_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO quotes_fts (rowid, content) VALUES (new.id, new.content);
+END;
+
+INSERT INTO quotes_fts (quotes_fts) VALUES ('rebuild');
+
+PRAGMA user_version = 2;
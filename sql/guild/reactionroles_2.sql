@@ -0,0 +1,16 @@
+CREATE TABLE reactionroles_new (
+  message INTEGER,
+  emoji TEXT,
+  role INTEGER
+);
+
+INSERT INTO reactionroles_new (message, emoji, role)
+  SELECT CAST(message AS INTEGER), emoji, CAST(role AS INTEGER) FROM reactionroles;
+
+DROP TABLE reactionroles;
+ALTER TABLE reactionroles_new RENAME TO reactionroles;
+
+CREATE INDEX reactionroles_message_emoji ON reactionroles (message, emoji);
+CREATE INDEX reactionroles_role ON reactionroles (role);
+
+PRAGMA user_version = 2;